@@ -3,11 +3,25 @@ Millpoint QC - Ravnsgaard Metal A/S
 Flask application with SQLite database
 """
 
+import csv
+import gzip
+import hashlib
+import io
+import itertools
+import json
 import os
+import queue
+import re
+import secrets
 import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, flash, g, jsonify
+from urllib.parse import urlparse
+from flask import Flask, render_template, request, redirect, url_for, flash, g, jsonify, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -15,6 +29,13 @@ from werkzeug.security import generate_password_hash, check_password_hash
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['DATABASE'] = os.path.join(app.root_path, 'qa.db')
+# Werkzeug hash method for new passwords, e.g. 'scrypt' or 'pbkdf2:sha256:260000'
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+# Optional directory for compiled templates, so restarted workers skip re-parsing them
+if os.environ.get('JINJA_CACHE_DIR'):
+    from jinja2 import FileSystemBytecodeCache
+    os.makedirs(os.environ['JINJA_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(os.environ['JINJA_CACHE_DIR'])
 
 # Upload configuration
 UPLOAD_FOLDER = os.path.join(app.root_path, 'static', 'uploads')
@@ -22,10 +43,6 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'xls',
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
 
-# Ensure upload directories exist
-for subdir in ['drawings', 'photos', 'certificates', 'documents']:
-    os.makedirs(os.path.join(UPLOAD_FOLDER, subdir), exist_ok=True)
-
 # Flask-Login setup
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -37,40 +54,186 @@ login_manager.login_message = 'Log ind for at få adgang til denne side.'
 # Database Helpers
 # =============================================================================
 
+# Idle connections kept for reuse across requests, one pool per database path
+DB_POOL_SIZE = 8
+_db_pools = {}
+
+
+def connect_db(path):
+    """Open a new tuned SQLite connection."""
+    # Pooled connections live long, so give the prepared-statement cache room
+    # for every distinct query string the app issues
+    db = sqlite3.connect(path, timeout=5.0, check_same_thread=False, cached_statements=512)
+    db.row_factory = sqlite3.Row
+    # Per-connection tuning; journal_mode=WAL is persisted by init_db()
+    db.execute('PRAGMA synchronous = NORMAL')
+    db.execute('PRAGMA busy_timeout = 5000')
+    db.execute('PRAGMA temp_store = MEMORY')
+    db.execute('PRAGMA cache_size = -20000')
+    db.execute('PRAGMA mmap_size = 268435456')
+    return db
+
+
+def _get_pool(path):
+    pool = _db_pools.get(path)
+    if pool is None:
+        pool = _db_pools.setdefault(path, queue.LifoQueue(maxsize=DB_POOL_SIZE))
+    return pool
+
+
 def get_db():
     """Get database connection for current request."""
     if 'db' not in g:
-        g.db = sqlite3.connect(app.config['DATABASE'])
-        g.db.row_factory = sqlite3.Row
+        path = app.config['DATABASE']
+        try:
+            g.db = _get_pool(path).get_nowait()
+        except queue.Empty:
+            g.db = connect_db(path)
+        g.db_path = path
     return g.db
 
 
 def close_db(e=None):
-    """Close database connection."""
+    """Return the request's connection to the pool."""
     db = g.pop('db', None)
+    path = g.pop('db_path', None)
     if db is not None:
-        db.close()
+        try:
+            # Discard anything the request left uncommitted
+            db.rollback()
+            _get_pool(path).put_nowait(db)
+        except (sqlite3.Error, queue.Full):
+            db.close()
 
 
 app.teardown_appcontext(close_db)
 
 
 def query_db(query, args=(), one=False):
-    """Query database and return results."""
+    """Query database and return results.
+    
+    With one=True only the first row is fetched; add a LIMIT to queries
+    that could match many rows so SQLite can stop early too.
+    """
     cur = get_db().execute(query, args)
-    rv = cur.fetchall()
+    rv = cur.fetchone() if one else cur.fetchall()
     cur.close()
-    return (rv[0] if rv else None) if one else rv
+    return rv
 
 
 def execute_db(query, args=()):
-    """Execute a database command (insert, update, delete)."""
+    """Execute a database command (insert, update, delete).
+    
+    Returns the lastrowid, or the first returned row for a statement with a
+    RETURNING clause.
+    """
     db = get_db()
     cur = db.execute(query, args)
-    db.commit()
-    lastrowid = cur.lastrowid
+    # RETURNING rows must be read before the commit
+    result = cur.fetchone() if cur.description else cur.lastrowid
+    cur.close()
+    finish_write(db, written_table(query))
+    return result
+
+
+def executemany_db(query, seq_of_args):
+    """Execute a database command for every args tuple in one transaction."""
+    db = get_db()
+    cur = db.executemany(query, seq_of_args)
+    rowcount = cur.rowcount
     cur.close()
-    return lastrowid
+    finish_write(db, written_table(query))
+    return rowcount
+
+
+def finish_write(db, table):
+    """Commit a write and drop cached reads of table, unless inside db_transaction()."""
+    pending = g.get('transaction_tables')
+    if pending is not None:
+        pending.add(table)
+        return
+    db.commit()
+    invalidate_cache(table)
+
+
+@contextmanager
+def db_transaction():
+    """Run the execute_db()/executemany_db() calls in the block as one transaction.
+    
+    Commits once when the block finishes and rolls everything back if it
+    raises. Cached reads of the written tables are dropped after the commit.
+    """
+    db = get_db()
+    g.transaction_tables = tables = set()
+    try:
+        yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        g.pop('transaction_tables')
+    for table in tables:
+        invalidate_cache(table)
+
+
+# =============================================================================
+# Query Cache
+# =============================================================================
+
+# key -> (expires_at, value, tables the value was computed from)
+#
+# The cache lives in each worker process. A write only invalidates entries in
+# the worker that made it, so other Gunicorn workers keep serving the old value
+# until its TTL runs out. Only aggregates where that lag is harmless are cached,
+# with short TTLs; lists users edit (users, suppliers, equipment, parts) are not.
+_cache = {}
+
+DASHBOARD_CACHE_TTL = 30  # seconds
+REPORTS_CACHE_TTL = 60  # seconds
+JOB_FORM_CACHE_TTL = 30  # seconds
+CACHE_MAX_ENTRIES = 500
+
+_WRITE_TABLE_RE = re.compile(
+    r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(\w+)',
+    re.IGNORECASE
+)
+
+
+def written_table(query):
+    """Return the table a write statement targets, or None if it can't be told."""
+    match = _WRITE_TABLE_RE.match(query)
+    return match.group(1).lower() if match else None
+
+
+def cached(key, ttl, fn, tables=()):
+    """Return fn() memoized under key for ttl seconds.
+    
+    The entry is dropped early when execute_db() writes to one of tables, but
+    only in this process; other workers see the write once ttl has passed.
+    """
+    now = time.monotonic()
+    entry = _cache.get(key)
+    if entry and entry[0] > now:
+        return entry[1]
+    value = fn()
+    if len(_cache) >= CACHE_MAX_ENTRIES:
+        # Keys like report date ranges are open-ended; drop what has expired
+        for stale_key, stale in list(_cache.items()):
+            if stale[0] <= now:
+                _cache.pop(stale_key, None)
+    _cache[key] = (now + ttl, value, frozenset(tables))
+    return value
+
+
+def invalidate_cache(table=None):
+    """Drop cached entries depending on table (everything if table is unknown)."""
+    if table is None:
+        _cache.clear()
+        return
+    for key, entry in list(_cache.items()):
+        if table in entry[2]:
+            _cache.pop(key, None)
 
 
 def get_or_create_part(part_number, part_revision='', part_description=None):
@@ -78,20 +241,21 @@ def get_or_create_part(part_number, part_revision='', part_description=None):
     # Normalize: treat empty string and None as same for revision
     part_revision = part_revision or ''
     
-    # Try to find existing part
-    existing = query_db(
-        'SELECT id FROM parts WHERE part_number = ? AND part_revision = ?',
-        [part_number, part_revision],
-        one=True
-    )
+    if part_description:
+        # Update description and get the id of an existing part in one statement
+        existing = execute_db('''
+            UPDATE parts SET part_description = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE part_number = ? AND part_revision = ?
+            RETURNING id
+        ''', [part_description, part_number, part_revision])
+    else:
+        existing = query_db(
+            'SELECT id FROM parts WHERE part_number = ? AND part_revision = ?',
+            [part_number, part_revision],
+            one=True
+        )
     
     if existing:
-        # Update description if provided and different
-        if part_description:
-            execute_db(
-                'UPDATE parts SET part_description = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
-                [part_description, existing['id']]
-            )
         return (existing['id'], False)
     
     # Create new part
@@ -106,10 +270,88 @@ def get_or_create_part(part_number, part_revision='', part_description=None):
 # Database Schema
 # =============================================================================
 
+# Bump whenever init_db() gains tables, columns, indexes or migrations
+SCHEMA_VERSION = 16
+
+
+def ensure_columns(db, table, columns):
+    """Add any of columns (name -> column definition) missing from table."""
+    existing = {row[1] for row in db.execute(f'PRAGMA table_info({table})')}
+    for name, definition in columns.items():
+        if name not in existing:
+            db.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+
+def require_unique(db, table, columns):
+    """Raise RuntimeError if table has rows sharing a value of columns.
+    
+    Run before adding a UNIQUE index to existing data, so conflicting QA
+    records are reported for someone to resolve instead of being deleted.
+    """
+    key = ', '.join(columns)
+    duplicates = db.execute(f'''
+        SELECT {key}, COUNT(*) FROM {table}
+        GROUP BY {key} HAVING COUNT(*) > 1
+    ''').fetchall()
+    if duplicates:
+        examples = '; '.join(
+            f"({', '.join(map(str, row[:-1]))}) x{row[-1]}" for row in duplicates[:5]
+        )
+        raise RuntimeError(
+            f'Cannot add a unique index on {table}({key}): {len(duplicates)} key(s) '
+            f'have duplicate rows, e.g. {examples}. Merge or remove the duplicates and restart.'
+        )
+
+
+def backfill_data(db):
+    """Fill in derived columns for rows written without them.
+    
+    Idempotent, and run on every start so an existing database that is
+    already at the current schema version still gets rows it was upgraded
+    with filled in (e.g. jobs created before the parts table had a part_id).
+    """
+    # Rows from before error_type existed count as internal errors
+    db.execute("UPDATE error_reports SET error_type = 'internal' WHERE error_type IS NULL")
+    
+    # Migrate existing jobs to use parts table
+    try:
+        # Create the missing parts, then point every job without part_id at its part
+        db.execute('''
+            INSERT OR IGNORE INTO parts (part_number, part_revision)
+            SELECT DISTINCT part_number, COALESCE(part_revision, '') FROM jobs
+            WHERE part_id IS NULL AND part_number IS NOT NULL AND part_number != ''
+        ''')
+        db.execute('''
+            UPDATE jobs SET part_id = (
+                SELECT p.id FROM parts p
+                WHERE p.part_number = jobs.part_number AND p.part_revision = COALESCE(jobs.part_revision, '')
+            )
+            WHERE part_id IS NULL AND part_number IS NOT NULL AND part_number != ''
+        ''')
+        
+        db.commit()
+    except Exception as e:
+        # Migration failed, but continue
+        db.rollback()
+        print(f"Migration warning: {e}")
+
+
 def init_db():
     """Initialize database with schema."""
     db = get_db()
     
+    # RETURNING (job numbers, part lookups) needs SQLite 3.35+
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        print(f"Warning: SQLite {sqlite3.sqlite_version} is too old; 3.35 or newer is required")
+    
+    # WAL lets dashboard reads run alongside inspection writes (persists on disk)
+    db.execute('PRAGMA journal_mode = WAL')
+    
+    # Already at the current schema; only the data backfills need to run
+    if db.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        backfill_data(db)
+        return
+    
     # Users table
     db.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -192,6 +434,29 @@ def init_db():
         )
     ''')
     
+    # Single-row sequence for internal job numbers
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS job_counter (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            next_num INTEGER NOT NULL
+        )
+    ''')
+    db.execute('''
+        INSERT OR IGNORE INTO job_counter (id, next_num)
+        SELECT 1, COALESCE(MAX(CAST(SUBSTR(internal_job_number, 4) AS INTEGER)), 0) + 1
+        FROM jobs WHERE internal_job_number LIKE 'JOB%'
+    ''')
+    # Keep the counter ahead of job numbers inserted directly (seed script, imports)
+    db.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_jobs_job_counter
+        AFTER INSERT ON jobs WHEN NEW.internal_job_number LIKE 'JOB%'
+        BEGIN
+            UPDATE job_counter
+            SET next_num = CAST(SUBSTR(NEW.internal_job_number, 4) AS INTEGER) + 1
+            WHERE id = 1 AND next_num <= CAST(SUBSTR(NEW.internal_job_number, 4) AS INTEGER);
+        END
+    ''')
+    
     # Job Documents
     db.execute('''
         CREATE TABLE IF NOT EXISTS job_documents (
@@ -376,74 +641,20 @@ def init_db():
         )
     ''')
     
-    # Add columns to existing error_reports table if they don't exist (migration)
-    try:
-        db.execute('ALTER TABLE error_reports ADD COLUMN error_type TEXT DEFAULT "internal"')
-    except:
-        pass
-    try:
-        db.execute('ALTER TABLE error_reports ADD COLUMN supplier_id INTEGER')
-    except:
-        pass
-    try:
-        db.execute('ALTER TABLE error_reports ADD COLUMN material_control_id INTEGER')
-    except:
-        pass
-    try:
-        db.execute('ALTER TABLE error_reports ADD COLUMN external_process_id INTEGER')
-    except:
-        pass
-    
-    # Add part_revision to jobs table if it doesn't exist (migration)
-    try:
-        db.execute('ALTER TABLE jobs ADD COLUMN part_revision TEXT')
-    except:
-        pass
+    # Add columns to existing tables if they don't exist (migration)
+    ensure_columns(db, 'error_reports', {
+        'error_type': "TEXT DEFAULT 'internal'",
+        'supplier_id': 'INTEGER',
+        'material_control_id': 'INTEGER',
+        'external_process_id': 'INTEGER',
+    })
+    ensure_columns(db, 'jobs', {
+        'part_revision': 'TEXT',
+        'part_id': 'INTEGER REFERENCES parts(id)',
+    })
     
-    # Add part_id to jobs table if it doesn't exist (migration)
-    try:
-        db.execute('ALTER TABLE jobs ADD COLUMN part_id INTEGER REFERENCES parts(id)')
-    except:
-        pass
+    backfill_data(db)
     
-    # Migrate existing jobs to use parts table
-    try:
-        # Get all jobs without part_id
-        jobs_without_part = db.execute('''
-            SELECT DISTINCT part_number, part_revision FROM jobs 
-            WHERE part_id IS NULL AND part_number IS NOT NULL AND part_number != ''
-        ''').fetchall()
-        
-        for job_row in jobs_without_part:
-            part_number = job_row[0]
-            part_revision = job_row[1] or ''
-            
-            # Get or create part
-            part = db.execute('''
-                SELECT id FROM parts WHERE part_number = ? AND part_revision = ?
-            ''', [part_number, part_revision]).fetchone()
-            
-            if part:
-                part_id = part[0]
-            else:
-                # Create part
-                cursor = db.execute('''
-                    INSERT INTO parts (part_number, part_revision) VALUES (?, ?)
-                ''', [part_number, part_revision])
-                part_id = cursor.lastrowid
-            
-            # Update all jobs with this part_number/revision
-            db.execute('''
-                UPDATE jobs SET part_id = ? 
-                WHERE part_number = ? AND (part_revision = ? OR (part_revision IS NULL AND ? = ''))
-            ''', [part_id, part_number, part_revision, part_revision])
-        
-        db.commit()
-    except Exception as e:
-        # Migration failed, but continue
-        print(f"Migration warning: {e}")
-        pass
-
     # Attachments
     db.execute('''
         CREATE TABLE IF NOT EXISTS attachments (
@@ -455,9 +666,13 @@ def init_db():
             file_type TEXT,
             uploaded_by INTEGER,
             uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sha256 TEXT,
             FOREIGN KEY (uploaded_by) REFERENCES users(id)
         )
     ''')
+    ensure_columns(db, 'attachments', {
+        'sha256': 'TEXT',
+    })
     
     # Equipment
     db.execute('''
@@ -509,26 +724,94 @@ def init_db():
     ''')
     
     # Create indexes
-    db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_workflow_stage ON jobs(workflow_stage)')
+    # Composite index serves stage equality lookups as well as the dashboard's
+    # stage/due date/completed filters, so the single-column one is dropped
+    db.execute('DROP INDEX IF EXISTS idx_jobs_workflow_stage')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_stage_due_completed ON jobs(workflow_stage, due_date, completed_at)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_po_number ON jobs(po_number)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_due_date ON jobs(due_date)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_customer ON jobs(customer_id)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_job_dimensions_job ON job_dimensions(job_id)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_material_controls_job ON material_controls(job_id)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_external_processes_job ON external_processes(job_id)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_measurement_reports_job ON measurement_reports(job_id)')
+    # Supplier error part filter and its DISTINCT part number dropdown
+    db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_part_number ON jobs(part_number)')
+    # Per-job lists come out of these in display order, without a sort step
+    db.execute('DROP INDEX IF EXISTS idx_job_dimensions_job')
+    db.execute('DROP INDEX IF EXISTS idx_material_controls_job')
+    db.execute('DROP INDEX IF EXISTS idx_external_processes_job')
+    db.execute('DROP INDEX IF EXISTS idx_measurement_reports_job')
+    db.execute('DROP INDEX IF EXISTS idx_exit_controls_job')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_job_dimensions_job_number ON job_dimensions(job_id, dimension_number)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_material_controls_job_created ON material_controls(job_id, created_at)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_external_processes_job_created ON external_processes(job_id, created_at)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_measurement_reports_job_created ON measurement_reports(job_id, created_at)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_exit_controls_job_created ON exit_controls(job_id, created_at)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_measurements_dimension ON measurements(job_dimension_id)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_error_reports_job ON error_reports(job_id)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_error_reports_status ON error_reports(status)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_error_reports_supplier ON error_reports(supplier_id)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_notifications_read ON notifications(user_id, read)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_parts_number_revision ON parts(part_number, part_revision)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_part ON jobs(part_id)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_exit_controls_job ON exit_controls(job_id)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_attachments_entity ON attachments(entity_type, entity_id)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_audit_logs_entity ON audit_logs(entity_type, entity_id)')
-    
+    # Covers the per-job open error counts as well as plain job_id lookups
+    db.execute('DROP INDEX IF EXISTS idx_error_reports_job')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_error_reports_job_status ON error_reports(job_id, status)')
+    db.execute('DROP INDEX IF EXISTS idx_error_reports_status')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_error_reports_status_found ON error_reports(status, found_date, error_type)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_error_reports_type_found ON error_reports(error_type, found_date)')
+    # Supplier list counts aggregate straight from these
+    db.execute('DROP INDEX IF EXISTS idx_error_reports_supplier')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_error_reports_supplier_status ON error_reports(supplier_id, status)')
+    # Supplier error history newest first, and the errors raised against one external process
+    db.execute('CREATE INDEX IF NOT EXISTS idx_error_reports_supplier_found ON error_reports(supplier_id, found_date)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_error_reports_external_process ON error_reports(external_process_id, found_date) WHERE external_process_id IS NOT NULL')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_material_controls_supplier ON material_controls(supplier_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_external_processes_supplier ON external_processes(supplier_id)')
+    # Per-user list by date, and a partial index for the unread badge/dropdown.
+    # Including read lets the polled unread COUNT run on the index alone.
+    db.execute('DROP INDEX IF EXISTS idx_notifications_user')
+    db.execute('DROP INDEX IF EXISTS idx_notifications_read')
+    db.execute('DROP INDEX IF EXISTS idx_notifications_user_unread')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications(user_id, created_at DESC)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_notifications_unread ON notifications(user_id, read, created_at DESC) WHERE read = 0')
+    # UNIQUE(part_number, part_revision) already has its own index
+    db.execute('DROP INDEX IF EXISTS idx_parts_number_revision')
+    # Part detail lists a part's jobs newest first straight from the index
+    db.execute('DROP INDEX IF EXISTS idx_jobs_part')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_part_created ON jobs(part_id, created_at)')
+    # Attachment lists come newest first straight from the index
+    db.execute('DROP INDEX IF EXISTS idx_attachments_entity')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_attachments_entity_time ON attachments(entity_type, entity_id, uploaded_at)')
+    # Re-uploaded certificates are matched by content hash
+    db.execute('CREATE INDEX IF NOT EXISTS idx_attachments_sha256 ON attachments(sha256) WHERE sha256 IS NOT NULL')
+    # Job detail reads the latest audit entries for an entity straight from the index
+    db.execute('DROP INDEX IF EXISTS idx_audit_logs_entity')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_audit_logs_entity_time ON audit_logs(entity_type, entity_id, timestamp)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_job_documents_job ON job_documents(job_id, uploaded_at)')
+    # One sample per part of a lot; adding extra samples relies on ON CONFLICT against this
+    require_unique(db, 'exit_control_samples', ('exit_control_id', 'part_number'))
+    db.execute('DROP INDEX IF EXISTS idx_exit_control_samples_ec')
+    db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_exit_control_samples_ec_part ON exit_control_samples(exit_control_id, part_number)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_equipment_active_due ON equipment(active, calibration_due_date)')
+    
+    # Date-range indexes for reports and exports
+    db.execute('CREATE INDEX IF NOT EXISTS idx_error_reports_found ON error_reports(found_date, job_id, supplier_id, severity, status, error_type)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_created_customer ON jobs(created_at, customer_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_completed ON jobs(completed_at) WHERE completed_at IS NOT NULL')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_exit_controls_inspection ON exit_controls(inspection_date, overall_status)')
+    # One measurement per dimension and sample of a report; editing upserts against this.
+    # Rows saved without a sample number get the next free numbers for their dimension.
+    last_sample = {(row[0], row[1]): row[2] or 0 for row in db.execute('''
+        SELECT report_id, job_dimension_id, MAX(sample_number) FROM measurements
+        GROUP BY report_id, job_dimension_id
+    ''')}
+    sample_numbers = []
+    for row in db.execute('SELECT id, report_id, job_dimension_id FROM measurements WHERE sample_number IS NULL ORDER BY id'):
+        key = (row[1], row[2])
+        last_sample[key] += 1
+        sample_numbers.append((last_sample[key], row[0]))
+    db.executemany('UPDATE measurements SET sample_number = ? WHERE id = ?', sample_numbers)
+    require_unique(db, 'measurements', ('report_id', 'job_dimension_id', 'sample_number'))
+    db.execute('DROP INDEX IF EXISTS idx_measurements_report')
+    db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_measurements_report_dimension_sample ON measurements(report_id, job_dimension_id, sample_number)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_measurements_equipment ON measurements(equipment_id, report_id)')
+    
+    # Refresh planner statistics so the composite indexes get picked
+    db.execute('ANALYZE')
+    
+    db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     db.commit()
 
 
@@ -546,7 +829,10 @@ class User(UserMixin):
     
     @staticmethod
     def get(user_id):
-        user = query_db('SELECT * FROM users WHERE id = ?', [user_id], one=True)
+        # Read fresh on every request so deactivation and role changes apply on
+        # all workers at once; it is a single primary-key lookup
+        user = query_db('SELECT id, username, email, role, active FROM users WHERE id = ?',
+                        [user_id], one=True)
         if user:
             return User(user['id'], user['username'], user['email'], user['role'], user['active'])
         return None
@@ -568,6 +854,22 @@ def load_user(user_id):
 # Authentication Routes
 # =============================================================================
 
+_dummy_password_hash = None
+
+
+def hash_password(password):
+    """Hash a password with the configured method."""
+    return generate_password_hash(password, method=app.config['PASSWORD_HASH_METHOD'])
+
+
+def dummy_password_hash():
+    """Hash checked for unknown usernames so they take as long as real ones."""
+    global _dummy_password_hash
+    if _dummy_password_hash is None:
+        _dummy_password_hash = hash_password(os.urandom(16).hex())
+    return _dummy_password_hash
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -578,8 +880,13 @@ def login():
         password = request.form.get('password', '')
         
         user = User.get_by_username(username)
+        if user:
+            password_ok = check_password_hash(user['password_hash'], password)
+        else:
+            check_password_hash(dummy_password_hash(), password)
+            password_ok = False
         
-        if user and check_password_hash(user['password_hash'], password):
+        if password_ok:
             if user['active']:
                 user_obj = User(user['id'], user['username'], user['email'], user['role'], user['active'])
                 login_user(user_obj)
@@ -624,33 +931,48 @@ def role_required(*roles):
 # Main Routes
 # =============================================================================
 
+WORKFLOW_STAGE_KEYS = ('po_receipt', 'revision_check', 'material_control', 'in_process',
+                       'external_process', 'exit_control', 'complete')
+
+
 @app.route('/')
 @login_required
 def index():
     """Main dashboard."""
-    # Job counts by stage
-    stage_counts = {
-        'po_receipt': query_db("SELECT COUNT(*) as count FROM jobs WHERE workflow_stage = 'po_receipt'", one=True)['count'],
-        'revision_check': query_db("SELECT COUNT(*) as count FROM jobs WHERE workflow_stage = 'revision_check'", one=True)['count'],
-        'material_control': query_db("SELECT COUNT(*) as count FROM jobs WHERE workflow_stage = 'material_control'", one=True)['count'],
-        'in_process': query_db("SELECT COUNT(*) as count FROM jobs WHERE workflow_stage = 'in_process'", one=True)['count'],
-        'external_process': query_db("SELECT COUNT(*) as count FROM jobs WHERE workflow_stage = 'external_process'", one=True)['count'],
-        'exit_control': query_db("SELECT COUNT(*) as count FROM jobs WHERE workflow_stage = 'exit_control'", one=True)['count'],
-        'complete': query_db("SELECT COUNT(*) as count FROM jobs WHERE workflow_stage = 'complete'", one=True)['count'],
-    }
+    # Job counts by stage (in WORKFLOW_STAGE_KEYS order) and key metrics in one pass over jobs
+    *stage_values, active_jobs, overdue_count = query_db('''
+        SELECT 
+            COALESCE(SUM(CASE WHEN workflow_stage = 'po_receipt' THEN 1 ELSE 0 END), 0) as po_receipt,
+            COALESCE(SUM(CASE WHEN workflow_stage = 'revision_check' THEN 1 ELSE 0 END), 0) as revision_check,
+            COALESCE(SUM(CASE WHEN workflow_stage = 'material_control' THEN 1 ELSE 0 END), 0) as material_control,
+            COALESCE(SUM(CASE WHEN workflow_stage = 'in_process' THEN 1 ELSE 0 END), 0) as in_process,
+            COALESCE(SUM(CASE WHEN workflow_stage = 'external_process' THEN 1 ELSE 0 END), 0) as external_process,
+            COALESCE(SUM(CASE WHEN workflow_stage = 'exit_control' THEN 1 ELSE 0 END), 0) as exit_control,
+            COALESCE(SUM(CASE WHEN workflow_stage = 'complete' THEN 1 ELSE 0 END), 0) as complete,
+            COALESCE(SUM(CASE WHEN workflow_stage != 'complete' THEN 1 ELSE 0 END), 0) as active_jobs,
+            COALESCE(SUM(CASE WHEN due_date < date('now') AND workflow_stage != 'complete' THEN 1 ELSE 0 END), 0) as overdue_count
+        FROM jobs
+    ''', one=True)
+    stage_counts = dict(zip(WORKFLOW_STAGE_KEYS, stage_values))
     
     # Key metrics
+    open_errors, pending_material, pending_external = query_db('''
+        SELECT 
+            (SELECT COUNT(*) FROM error_reports WHERE status = 'open') as open_errors,
+            (SELECT COUNT(*) FROM material_controls WHERE status = 'pending') as pending_material,
+            (SELECT COUNT(*) FROM external_processes WHERE status IN ('sent', 'received')) as pending_external
+    ''', one=True)
     stats = {
-        'active_jobs': query_db("SELECT COUNT(*) as count FROM jobs WHERE workflow_stage != 'complete'", one=True)['count'],
+        'active_jobs': active_jobs,
         'completed_jobs': stage_counts['complete'],
-        'overdue_count': query_db("SELECT COUNT(*) as count FROM jobs WHERE due_date < date('now') AND workflow_stage != 'complete'", one=True)['count'],
-        'open_errors': query_db("SELECT COUNT(*) as count FROM error_reports WHERE status = 'open'", one=True)['count'],
-        'pending_material': query_db("SELECT COUNT(*) as count FROM material_controls WHERE status = 'pending'", one=True)['count'],
-        'pending_external': query_db("SELECT COUNT(*) as count FROM external_processes WHERE status IN ('sent', 'received')", one=True)['count'],
+        'overdue_count': overdue_count,
+        'open_errors': open_errors,
+        'pending_material': pending_material,
+        'pending_external': pending_external,
     }
     
-    # Quality metrics (last 30 days)
-    quality_stats = query_db('''
+    # Aggregates below change slowly; serve them from the short-TTL cache
+    quality_stats = cached('dashboard:quality_stats', DASHBOARD_CACHE_TTL, lambda: query_db('''
         SELECT 
             (SELECT COUNT(*) FROM error_reports WHERE found_date >= date('now', '-30 days')) as errors_30d,
             (SELECT COUNT(*) FROM error_reports WHERE found_date >= date('now', '-30 days') AND error_type = 'material_supplier') as material_errors_30d,
@@ -658,54 +980,72 @@ def index():
             (SELECT COUNT(*) FROM exit_controls WHERE inspection_date >= date('now', '-30 days') AND overall_status = 'passed') as exit_passed_30d,
             (SELECT COUNT(*) FROM exit_controls WHERE inspection_date >= date('now', '-30 days') AND overall_status = 'failed') as exit_failed_30d,
             (SELECT COUNT(*) FROM jobs WHERE completed_at >= date('now', '-30 days')) as completed_30d
-    ''', one=True)
-    
-    # Jobs completed per week (last 8 weeks) for chart
-    weekly_completions = query_db('''
-        SELECT 
-            strftime('%Y-%W', completed_at) as week,
-            COUNT(*) as count
-        FROM jobs 
-        WHERE completed_at >= date('now', '-56 days') AND workflow_stage = 'complete'
-        GROUP BY week
-        ORDER BY week
-    ''')
+    ''', one=True), tables=('error_reports', 'exit_controls', 'jobs'))
     
-    # Errors by type for chart
-    errors_by_type_rows = query_db('''
-        SELECT 
-            COALESCE(error_type, 'internal') as error_type,
-            COUNT(*) as count
-        FROM error_reports
-        WHERE found_date >= date('now', '-90 days')
-        GROUP BY error_type
+    # Get recent jobs
+    recent_jobs = query_db('''
+        SELECT j.id, j.internal_job_number, j.po_number, j.part_number, j.part_revision,
+               j.quantity, j.due_date, j.workflow_stage, c.name as customer_name 
+        FROM jobs j 
+        LEFT JOIN customers c ON j.customer_id = c.id 
+        ORDER BY j.created_at DESC 
+        LIMIT 8
     ''')
-    # Convert to list of dicts for JSON serialization
-    errors_by_type = [{'error_type': row['error_type'], 'count': row['count']} for row in errors_by_type_rows]
     
-    # Top suppliers with issues
-    problem_suppliers = query_db('''
-        SELECT s.name, s.supplier_type, COUNT(er.id) as error_count,
-               SUM(CASE WHEN er.status = 'open' THEN 1 ELSE 0 END) as open_count
-        FROM error_reports er
-        JOIN suppliers s ON er.supplier_id = s.id
-        WHERE er.found_date >= date('now', '-90 days')
-        GROUP BY s.id
-        ORDER BY error_count DESC
-        LIMIT 5
-    ''')
+    # Charts and panels below the fold are loaded from /api/dashboard/<section>
+    return render_template('index.html', 
+                          stats=stats,
+                          stage_counts=stage_counts,
+                          quality_stats=quality_stats,
+                          recent_jobs=recent_jobs)
+
+
+def dashboard_errors_by_type():
+    """Errors by type (last 90 days) for chart, encoded as JSON by SQLite."""
+    return cached('dashboard:errors_by_type', DASHBOARD_CACHE_TTL, lambda: query_db('''
+        SELECT json_group_array(json_object('error_type', error_type, 'count', count))
+        FROM (
+            SELECT error_type, COUNT(*) as count
+            FROM error_reports
+            WHERE found_date >= date('now', '-90 days')
+            GROUP BY error_type
+        )
+    ''', one=True)[0], tables=('error_reports',))
+
+
+def dashboard_problem_suppliers():
+    """Top suppliers with issues (last 90 days)."""
+    return cached('dashboard:problem_suppliers', DASHBOARD_CACHE_TTL, lambda: [
+        dict(row) for row in query_db('''
+            SELECT s.name, s.supplier_type, COUNT(er.id) as error_count,
+                   SUM(CASE WHEN er.status = 'open' THEN 1 ELSE 0 END) as open_count
+            FROM error_reports er
+            JOIN suppliers s ON er.supplier_id = s.id
+            WHERE er.found_date >= date('now', '-90 days')
+            GROUP BY s.id
+            ORDER BY error_count DESC
+            LIMIT 5
+        ''')
+    ], tables=('error_reports', 'suppliers'))
+
+
+def dashboard_equipment_alerts():
+    """Equipment calibration alerts.
     
-    # Equipment calibration alerts
-    equipment_alerts_rows = query_db('''
+    Status is derived at read time: it depends on today's date, which SQLite
+    won't allow in a generated column and a write-time trigger would let go stale.
+    """
+    today, soon = calibration_bounds()
+    rows = cached(f'dashboard:equipment_alerts:{today}', DASHBOARD_CACHE_TTL, lambda: query_db('''
         SELECT id, name, equipment_type, calibration_due_date,
             CASE 
                 WHEN calibration_due_date IS NULL THEN 'ok'
-                WHEN calibration_due_date < date('now') THEN 'overdue'
+                WHEN calibration_due_date < ? THEN 'overdue'
                 ELSE 'due_soon'
             END as status
         FROM equipment
         WHERE active = 1 
-          AND (calibration_due_date IS NULL OR calibration_due_date <= date('now', '+30 days'))
+          AND (calibration_due_date IS NULL OR calibration_due_date <= ?)
         ORDER BY 
             CASE 
                 WHEN calibration_due_date IS NULL THEN 1
@@ -713,31 +1053,26 @@ def index():
             END,
             calibration_due_date ASC
         LIMIT 5
-    ''')
-    equipment_alerts = equipment_alerts_rows if equipment_alerts_rows else []
-    
-    # Get recent jobs
-    recent_jobs = query_db('''
-        SELECT j.*, c.name as customer_name 
-        FROM jobs j 
-        LEFT JOIN customers c ON j.customer_id = c.id 
-        ORDER BY j.created_at DESC 
-        LIMIT 8
-    ''')
-    
-    # Get overdue jobs
-    overdue_jobs = query_db('''
-        SELECT j.*, c.name as customer_name 
-        FROM jobs j 
-        LEFT JOIN customers c ON j.customer_id = c.id 
-        WHERE j.due_date < date('now') AND j.workflow_stage != 'complete'
-        ORDER BY j.due_date ASC
+    ''', [today, soon]), tables=('equipment',))
+    return [dict(row, url=url_for('equipment_detail', equip_id=row['id'])) for row in rows]
+
+
+def dashboard_overdue_jobs():
+    """Overdue jobs, oldest due date first."""
+    rows = query_db('''
+        SELECT id, internal_job_number, part_number, due_date, workflow_stage
+        FROM jobs
+        WHERE due_date < date('now') AND workflow_stage != 'complete'
+        ORDER BY due_date ASC
         LIMIT 5
     ''')
-    
-    # Get open error reports
-    open_errors = query_db('''
-        SELECT e.*, j.po_number, j.part_number, s.name as supplier_name
+    return [dict(row, url=url_for('job_detail', job_id=row['id'])) for row in rows]
+
+
+def dashboard_open_errors():
+    """Most recent open error reports."""
+    rows = query_db('''
+        SELECT e.id, e.severity, j.part_number, s.name as supplier_name
         FROM error_reports e 
         JOIN jobs j ON e.job_id = j.id 
         LEFT JOIN suppliers s ON e.supplier_id = s.id
@@ -745,18 +1080,30 @@ def index():
         ORDER BY e.found_date DESC
         LIMIT 5
     ''')
-    
-    return render_template('index.html', 
-                          stats=stats,
-                          stage_counts=stage_counts,
-                          quality_stats=quality_stats,
-                          weekly_completions=weekly_completions,
-                          errors_by_type=errors_by_type,
-                          problem_suppliers=problem_suppliers,
-                          equipment_alerts=equipment_alerts,
-                          recent_jobs=recent_jobs,
-                          overdue_jobs=overdue_jobs,
-                          open_errors=open_errors)
+    return [dict(row, url=url_for('error_report_detail', error_id=row['id'])) for row in rows]
+
+
+DASHBOARD_SECTIONS = {
+    'errors_by_type': dashboard_errors_by_type,
+    'problem_suppliers': dashboard_problem_suppliers,
+    'equipment_alerts': dashboard_equipment_alerts,
+    'overdue_jobs': dashboard_overdue_jobs,
+    'open_errors': dashboard_open_errors,
+}
+
+
+@app.route('/api/dashboard/<section>')
+@login_required
+def api_dashboard_section(section):
+    """Return one of the dashboard's deferred sections as JSON."""
+    loader = DASHBOARD_SECTIONS.get(section)
+    if loader is None:
+        return jsonify({'error': 'Unknown dashboard section'}), 404
+    data = loader()
+    if isinstance(data, str):
+        # Already encoded by SQLite
+        return app.response_class(data, mimetype='application/json')
+    return jsonify(data)
 
 
 # =============================================================================
@@ -770,80 +1117,131 @@ def reports():
     # Date range from query params (default last 30 days)
     from_date = request.args.get('from', (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
     to_date = request.args.get('to', datetime.now().strftime('%Y-%m-%d'))
+    range_start, range_end = date_bounds(from_date, to_date)
     
+    data = cached(f'reports:{range_start}:{range_end}', REPORTS_CACHE_TTL,
+                  lambda: reports_data(range_start, range_end),
+                  tables=('jobs', 'error_reports', 'exit_controls', 'suppliers', 'customers'))
+    
+    return render_template('reports.html', from_date=from_date, to_date=to_date, **data)
+
+
+def reports_data(range_start, range_end):
+    """Aggregates shown on the reports page for [range_start, range_end)."""
     # Job completion stats
     job_stats = query_db('''
         SELECT 
             COUNT(*) as total_completed,
             SUM(quantity) as total_parts
         FROM jobs
-        WHERE completed_at BETWEEN ? AND date(?, '+1 day')
-    ''', [from_date, to_date], one=True)
-    
-    # Error stats
-    error_stats = query_db('''
+        WHERE completed_at >= ? AND completed_at < ?
+    ''', [range_start, range_end], one=True)
+    
+    # Error stats, top parts and supplier performance from one pass over the
+    # date window; each block comes back as JSON so a single statement can
+    # return all three shapes
+    error_summary = query_db('''
+        WITH er_window AS MATERIALIZED (
+            SELECT id, job_id, supplier_id, severity, error_type, status
+            FROM error_reports
+            WHERE found_date >= ? AND found_date < ?
+        )
         SELECT 
-            COUNT(*) as total_errors,
-            SUM(CASE WHEN error_type = 'material_supplier' THEN 1 ELSE 0 END) as material_errors,
-            SUM(CASE WHEN error_type = 'external_supplier' THEN 1 ELSE 0 END) as external_errors,
-            SUM(CASE WHEN error_type = 'internal' OR error_type IS NULL THEN 1 ELSE 0 END) as internal_errors,
-            SUM(CASE WHEN severity = 'critical' THEN 1 ELSE 0 END) as critical_errors,
-            SUM(CASE WHEN severity = 'major' THEN 1 ELSE 0 END) as major_errors,
-            SUM(CASE WHEN status = 'closed' THEN 1 ELSE 0 END) as closed_errors
-        FROM error_reports
-        WHERE found_date BETWEEN ? AND date(?, '+1 day')
-    ''', [from_date, to_date], one=True)
+            (SELECT json_object(
+                'total_errors', COUNT(*),
+                'material_errors', COALESCE(SUM(CASE WHEN error_type = 'material_supplier' THEN 1 ELSE 0 END), 0),
+                'external_errors', COALESCE(SUM(CASE WHEN error_type = 'external_supplier' THEN 1 ELSE 0 END), 0),
+                'internal_errors', COALESCE(SUM(CASE WHEN error_type = 'internal' OR error_type IS NULL THEN 1 ELSE 0 END), 0),
+                'critical_errors', COALESCE(SUM(CASE WHEN severity = 'critical' THEN 1 ELSE 0 END), 0),
+                'major_errors', COALESCE(SUM(CASE WHEN severity = 'major' THEN 1 ELSE 0 END), 0),
+                'closed_errors', COALESCE(SUM(CASE WHEN status = 'closed' THEN 1 ELSE 0 END), 0)
+            ) FROM er_window) as error_stats,
+            (SELECT json_group_array(json_object(
+                'part_number', part_number, 'part_revision', part_revision, 'error_count', error_count
+            )) FROM (
+                SELECT j.part_number, j.part_revision, COUNT(w.id) as error_count
+                FROM er_window w
+                JOIN jobs j ON w.job_id = j.id
+                GROUP BY j.part_number, j.part_revision
+                ORDER BY error_count DESC
+                LIMIT 10
+            )) as parts_with_errors,
+            (SELECT json_group_array(json_object(
+                'name', name, 'supplier_type', supplier_type,
+                'error_count', error_count, 'critical_count', critical_count
+            )) FROM (
+                SELECT s.name, s.supplier_type,
+                       COUNT(w.id) as error_count,
+                       SUM(CASE WHEN w.severity = 'critical' THEN 1 ELSE 0 END) as critical_count
+                FROM suppliers s
+                LEFT JOIN er_window w ON w.supplier_id = s.id
+                WHERE s.active = 1
+                GROUP BY s.id
+                ORDER BY error_count DESC
+            )) as supplier_performance
+    ''', [range_start, range_end], one=True)
+    error_stats = json.loads(error_summary['error_stats'])
+    parts_with_errors = json.loads(error_summary['parts_with_errors'])
+    supplier_performance = json.loads(error_summary['supplier_performance'])
     
     # Exit control stats
     exit_stats = query_db('''
         SELECT 
             COUNT(*) as total_inspections,
-            SUM(CASE WHEN overall_status = 'passed' THEN 1 ELSE 0 END) as passed,
-            SUM(CASE WHEN overall_status = 'failed' THEN 1 ELSE 0 END) as failed
+            COALESCE(SUM(CASE WHEN overall_status = 'passed' THEN 1 ELSE 0 END), 0) as passed,
+            COALESCE(SUM(CASE WHEN overall_status = 'failed' THEN 1 ELSE 0 END), 0) as failed
         FROM exit_controls
-        WHERE inspection_date BETWEEN ? AND date(?, '+1 day')
-    ''', [from_date, to_date], one=True)
-    
-    # Top parts with errors
-    parts_with_errors = query_db('''
-        SELECT j.part_number, j.part_revision, COUNT(er.id) as error_count
-        FROM error_reports er
-        JOIN jobs j ON er.job_id = j.id
-        WHERE er.found_date BETWEEN ? AND date(?, '+1 day')
-        GROUP BY j.part_number, j.part_revision
-        ORDER BY error_count DESC
-        LIMIT 10
-    ''', [from_date, to_date])
-    
-    # Supplier performance
-    supplier_performance = query_db('''
-        SELECT s.name, s.supplier_type,
-               COUNT(er.id) as error_count,
-               SUM(CASE WHEN er.severity = 'critical' THEN 1 ELSE 0 END) as critical_count
-        FROM suppliers s
-        LEFT JOIN error_reports er ON er.supplier_id = s.id 
-            AND er.found_date BETWEEN ? AND date(?, '+1 day')
-        WHERE s.active = 1
-        GROUP BY s.id
-        ORDER BY error_count DESC
-    ''', [from_date, to_date])
+        WHERE inspection_date >= ? AND inspection_date < ?
+    ''', [range_start, range_end], one=True)
     
     # Jobs by customer
     jobs_by_customer = query_db('''
         SELECT c.name, COUNT(j.id) as job_count, SUM(j.quantity) as total_qty
         FROM jobs j
         JOIN customers c ON j.customer_id = c.id
-        WHERE j.created_at BETWEEN ? AND date(?, '+1 day')
+        WHERE j.created_at >= ? AND j.created_at < ?
         GROUP BY c.id
         ORDER BY job_count DESC
-    ''', [from_date, to_date])
+    ''', [range_start, range_end])
     
-    return render_template('reports.html',
-                          from_date=from_date, to_date=to_date,
-                          job_stats=job_stats, error_stats=error_stats,
-                          exit_stats=exit_stats, parts_with_errors=parts_with_errors,
-                          supplier_performance=supplier_performance,
-                          jobs_by_customer=jobs_by_customer)
+    return {
+        'job_stats': job_stats,
+        'error_stats': error_stats,
+        'exit_stats': exit_stats,
+        'parts_with_errors': parts_with_errors,
+        'supplier_performance': supplier_performance,
+        'jobs_by_customer': jobs_by_customer,
+    }
+
+
+CSV_BATCH_SIZE = 1000
+
+
+def export_cursor():
+    """Cursor returning plain tuples, for exports that stream rows positionally."""
+    cur = get_db().cursor()
+    cur.row_factory = None
+    return cur
+
+
+def csv_response(filename, header, rows):
+    """Stream rows as a CSV download, CSV_BATCH_SIZE rows per chunk."""
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        yield ','.join(header) + '\n'
+        row_iter = iter(rows)
+        while batch := list(itertools.islice(row_iter, CSV_BATCH_SIZE)):
+            writer.writerows(batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    
+    return app.response_class(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment;filename={filename}'}
+    )
 
 
 @app.route('/reports/export/jobs')
@@ -852,43 +1250,29 @@ def export_jobs_csv():
     """Export jobs to CSV."""
     from_date = request.args.get('from', '2000-01-01')
     to_date = request.args.get('to', '2099-12-31')
-    
-    jobs = query_db('''
-        SELECT j.internal_job_number, j.po_number, j.part_number, j.part_revision,
-               j.quantity, j.due_date, j.workflow_stage, j.created_at, j.completed_at,
-               c.name as customer_name
+    range_start, range_end = date_bounds(from_date, to_date)
+    
+    # Columns come out of SQL already formatted, in CSV order, as plain tuples,
+    # so the cursor is streamed straight into the writer
+    jobs = export_cursor()
+    jobs.execute('''
+        SELECT COALESCE(j.internal_job_number, ''), COALESCE(j.po_number, ''),
+               COALESCE(j.part_number, ''), COALESCE(j.part_revision, ''),
+               COALESCE(NULLIF(j.quantity, 0), ''), COALESCE(j.due_date, ''),
+               COALESCE(j.workflow_stage, ''), SUBSTR(COALESCE(j.created_at, ''), 1, 10),
+               SUBSTR(COALESCE(j.completed_at, ''), 1, 10), COALESCE(c.name, '')
         FROM jobs j
         LEFT JOIN customers c ON j.customer_id = c.id
-        WHERE j.created_at BETWEEN ? AND date(?, '+1 day')
+        WHERE j.created_at >= ? AND j.created_at < ?
         ORDER BY j.created_at DESC
-    ''', [from_date, to_date])
-    
-    # Generate CSV
-    import io
-    output = io.StringIO()
-    output.write('Job Number,PO Number,Part Number,Revision,Quantity,Due Date,Stage,Created,Completed,Customer\n')
-    
-    for job in jobs:
-        row = [
-            job['internal_job_number'] or '',
-            job['po_number'] or '',
-            job['part_number'] or '',
-            job['part_revision'] or '',
-            str(job['quantity'] or ''),
-            job['due_date'] or '',
-            job['workflow_stage'] or '',
-            (job['created_at'] or '')[:10],
-            (job['completed_at'] or '')[:10] if job['completed_at'] else '',
-            job['customer_name'] or ''
-        ]
-        output.write(','.join(f'"{v}"' for v in row) + '\n')
+    ''', [range_start, range_end])
     
-    response = app.response_class(
-        output.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': f'attachment;filename=jobs_{from_date}_to_{to_date}.csv'}
+    return csv_response(
+        f'jobs_{from_date}_to_{to_date}.csv',
+        ['Job Number', 'PO Number', 'Part Number', 'Revision', 'Quantity', 'Due Date', 'Stage',
+         'Created', 'Completed', 'Customer'],
+        jobs
     )
-    return response
 
 
 @app.route('/reports/export/errors')
@@ -897,82 +1281,74 @@ def export_errors_csv():
     """Export error reports to CSV."""
     from_date = request.args.get('from', '2000-01-01')
     to_date = request.args.get('to', '2099-12-31')
-    
-    errors = query_db('''
-        SELECT er.id, er.found_date, er.severity, er.error_type, er.status,
-               er.description, er.disposition, er.root_cause, er.corrective_action,
-               j.internal_job_number, j.part_number, j.part_revision,
-               s.name as supplier_name
+    range_start, range_end = date_bounds(from_date, to_date)
+    
+    errors = export_cursor()
+    errors.execute('''
+        SELECT printf('ER-%04d', er.id), SUBSTR(COALESCE(er.found_date, ''), 1, 10),
+               COALESCE(j.internal_job_number, ''), COALESCE(j.part_number, ''),
+               COALESCE(j.part_revision, ''), COALESCE(NULLIF(s.name, ''), 'Internal'),
+               COALESCE(NULLIF(er.error_type, ''), 'internal'),
+               COALESCE(er.severity, ''), COALESCE(er.status, ''),
+               SUBSTR(REPLACE(COALESCE(er.description, ''), char(10), ' '), 1, 100),
+               COALESCE(er.disposition, ''),
+               SUBSTR(REPLACE(COALESCE(er.root_cause, ''), char(10), ' '), 1, 100),
+               SUBSTR(REPLACE(COALESCE(er.corrective_action, ''), char(10), ' '), 1, 100)
         FROM error_reports er
         JOIN jobs j ON er.job_id = j.id
         LEFT JOIN suppliers s ON er.supplier_id = s.id
-        WHERE er.found_date BETWEEN ? AND date(?, '+1 day')
+        WHERE er.found_date >= ? AND er.found_date < ?
         ORDER BY er.found_date DESC
-    ''', [from_date, to_date])
-    
-    import io
-    output = io.StringIO()
-    output.write('ID,Date,Job,Part,Revision,Supplier,Type,Severity,Status,Description,Disposition,Root Cause,Corrective Action\n')
-    
-    for err in errors:
-        row = [
-            f'ER-{err["id"]:04d}',
-            (err['found_date'] or '')[:10],
-            err['internal_job_number'] or '',
-            err['part_number'] or '',
-            err['part_revision'] or '',
-            err['supplier_name'] or 'Internal',
-            (err['error_type'] or 'internal').replace('_', ' ').title(),
-            err['severity'] or '',
-            err['status'] or '',
-            (err['description'] or '').replace('"', "'").replace('\n', ' ')[:100],
-            err['disposition'] or '',
-            (err['root_cause'] or '').replace('"', "'").replace('\n', ' ')[:100],
-            (err['corrective_action'] or '').replace('"', "'").replace('\n', ' ')[:100]
-        ]
-        output.write(','.join(f'"{v}"' for v in row) + '\n')
+    ''', [range_start, range_end])
     
-    response = app.response_class(
-        output.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': f'attachment;filename=errors_{from_date}_to_{to_date}.csv'}
+    # Only the type label needs Python (title-casing each word)
+    rows = (row[:6] + (row[6].replace('_', ' ').title(),) + row[7:] for row in errors)
+    
+    return csv_response(
+        f'errors_{from_date}_to_{to_date}.csv',
+        ['ID', 'Date', 'Job', 'Part', 'Revision', 'Supplier', 'Type', 'Severity', 'Status',
+         'Description', 'Disposition', 'Root Cause', 'Corrective Action'],
+        rows
     )
-    return response
 
 
 # =============================================================================
 # Equipment Routes
 # =============================================================================
 
+def calibration_bounds():
+    """Return (today, today + 30 days) in local time as ISO dates.
+    
+    Calibration status is always computed from these, never from SQLite's
+    date('now'), which is UTC and can be a day off around midnight.
+    """
+    today = datetime.now().date()
+    return today.isoformat(), (today + timedelta(days=30)).isoformat()
+
+
 @app.route('/equipment')
 @login_required
 def equipment_list():
     """List all equipment with calibration status."""
+    # The status can't be stored since it changes with the date, not with the row
+    today, soon = calibration_bounds()
     equipment = query_db('''
         SELECT *,
             CASE 
                 WHEN calibration_due_date IS NULL THEN 'ok'
-                WHEN calibration_due_date < date('now') THEN 'overdue'
-                WHEN calibration_due_date <= date('now', '+30 days') THEN 'due_soon'
+                WHEN calibration_due_date < ? THEN 'overdue'
+                WHEN calibration_due_date <= ? THEN 'due_soon'
                 ELSE 'ok'
             END as cal_status
         FROM equipment
         WHERE active = 1
-        ORDER BY 
-            CASE 
-                WHEN calibration_due_date IS NULL THEN 1
-                ELSE 0
-            END,
-            calibration_due_date ASC
-    ''')
+        ORDER BY calibration_due_date IS NULL, calibration_due_date ASC
+    ''', [today, soon])
     
     # Stats
-    stats = {
-        'total': len(equipment),
-        'overdue': sum(1 for e in equipment if e['cal_status'] == 'overdue'),
-        'due_soon': sum(1 for e in equipment if e['cal_status'] == 'due_soon'),
-        'ok': sum(1 for e in equipment if e['cal_status'] == 'ok')
-    }
+    stats = {'total': len(equipment), 'overdue': 0, 'due_soon': 0, 'ok': 0}
+    for e in equipment:
+        stats[e['cal_status']] += 1
     
     return render_template('equipment.html', equipment=equipment, stats=stats, mode='list')
 
@@ -992,23 +1368,18 @@ def equipment_create():
         
         # Calculate due date
         if last_calibration:
-            due_date = query_db(
-                "SELECT date(?, '+' || ? || ' days') as due",
-                [last_calibration, calibration_interval], one=True
-            )['due']
+            due_date = add_days(last_calibration, calibration_interval)
         else:
             due_date = None
         
-        db = get_db()
-        cursor = db.execute('''
+        equip_id = execute_db('''
             INSERT INTO equipment (name, equipment_type, serial_number, manufacturer,
                                   calibration_interval_days, last_calibration_date, calibration_due_date)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         ''', [name, equipment_type, serial_number, manufacturer, calibration_interval, last_calibration, due_date])
-        db.commit()
         
         flash(f'Udstyr "{name}" oprettet.', 'success')
-        return redirect(url_for('equipment_detail', equip_id=cursor.lastrowid))
+        return redirect(url_for('equipment_detail', equip_id=equip_id))
     
     return render_template('equipment.html', mode='create')
 
@@ -1037,10 +1408,10 @@ def equipment_detail(equip_id):
     cal_status = 'ok'
     if equipment['calibration_due_date']:
         due = equipment['calibration_due_date']
-        today = datetime.now().strftime('%Y-%m-%d')
+        today, soon = calibration_bounds()
         if due < today:
             cal_status = 'overdue'
-        elif due <= (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d'):
+        elif due <= soon:
             cal_status = 'due_soon'
     
     return render_template('equipment.html', equipment=equipment, reports=reports, 
@@ -1068,15 +1439,11 @@ def equipment_edit(equip_id):
         
         # Calculate due date
         if last_calibration:
-            due_date = query_db(
-                "SELECT date(?, '+' || ? || ' days') as due",
-                [last_calibration, calibration_interval], one=True
-            )['due']
+            due_date = add_days(last_calibration, calibration_interval)
         else:
             due_date = None
         
-        db = get_db()
-        db.execute('''
+        execute_db('''
             UPDATE equipment SET name = ?, equipment_type = ?, serial_number = ?,
                    manufacturer = ?, calibration_interval_days = ?, 
                    last_calibration_date = ?, calibration_due_date = ?,
@@ -1084,7 +1451,6 @@ def equipment_edit(equip_id):
             WHERE id = ?
         ''', [name, equipment_type, serial_number, manufacturer, calibration_interval,
               last_calibration, due_date, active, equip_id])
-        db.commit()
         
         flash('Udstyr opdateret.', 'success')
         return redirect(url_for('equipment_detail', equip_id=equip_id))
@@ -1106,18 +1472,13 @@ def equipment_calibrate(equip_id):
     interval = equipment['calibration_interval_days'] or 365
     
     # Calculate new due date
-    due_date = query_db(
-        "SELECT date(?, '+' || ? || ' days') as due",
-        [calibration_date, interval], one=True
-    )['due']
+    due_date = add_days(calibration_date, interval)
     
-    db = get_db()
-    db.execute('''
+    execute_db('''
         UPDATE equipment SET last_calibration_date = ?, calibration_due_date = ?,
                calibration_status = 'ok', updated_at = CURRENT_TIMESTAMP
         WHERE id = ?
     ''', [calibration_date, due_date, equip_id])
-    db.commit()
     
     flash(f'Kalibrering registreret. Næste kalibrering: {due_date}', 'success')
     return redirect(url_for('equipment_detail', equip_id=equip_id))
@@ -1164,25 +1525,57 @@ def part_detail(part_id):
         flash('Delen blev ikke fundet.', 'error')
         return redirect(url_for('parts_list'))
     
-    # Get all jobs using this part
-    jobs = query_db('''
+    # Each list pages independently with its own (date, id) keyset cursor
+    jobs_after_created = request.args.get('jobs_after_created', '')
+    jobs_after_id = request.args.get('jobs_after_id', type=int)
+    errors_after_found = request.args.get('errors_after_found', '')
+    errors_after_id = request.args.get('errors_after_id', type=int)
+    
+    # Latest jobs using this part (idx_jobs_part_created, no sort step)
+    query = '''
         SELECT j.*, c.name as customer_name
         FROM jobs j
         LEFT JOIN customers c ON j.customer_id = c.id
         WHERE j.part_id = ?
-        ORDER BY j.created_at DESC
-    ''', [part_id])
-    
-    # Get error reports for this part
-    errors = query_db('''
+    '''
+    params = [part_id]
+    if jobs_after_created and jobs_after_id:
+        query += ' AND (j.created_at, j.id) < (?, ?)'
+        params.extend([jobs_after_created, jobs_after_id])
+    query += ' ORDER BY j.created_at DESC, j.id DESC LIMIT ?'
+    params.append(PART_DETAIL_LIMIT + 1)
+    jobs, jobs_cursor = keyset_page(query_db(query, params), PART_DETAIL_LIMIT, 'created_at')
+    
+    # Latest error reports for this part
+    query = '''
         SELECT er.*, j.po_number, j.internal_job_number
         FROM error_reports er
         JOIN jobs j ON er.job_id = j.id
         WHERE j.part_id = ?
-        ORDER BY er.found_date DESC
-    ''', [part_id])
-    
-    return render_template('part_detail.html', part=part, jobs=jobs, errors=errors)
+    '''
+    params = [part_id]
+    if errors_after_found and errors_after_id:
+        query += ' AND (er.found_date, er.id) < (?, ?)'
+        params.extend([errors_after_found, errors_after_id])
+    query += ' ORDER BY er.found_date DESC, er.id DESC LIMIT ?'
+    params.append(PART_DETAIL_LIMIT + 1)
+    errors, errors_cursor = keyset_page(query_db(query, params), PART_DETAIL_LIMIT, 'found_date')
+    
+    # Totals for the headers, without loading every row
+    counts = query_db('''
+        SELECT COUNT(*) as job_count,
+               (SELECT COUNT(*) FROM error_reports er
+                JOIN jobs j ON er.job_id = j.id
+                WHERE j.part_id = ?) as error_count
+        FROM jobs WHERE part_id = ?
+    ''', [part_id, part_id], one=True)
+    
+    jobs_next = {'jobs_after_created': jobs_cursor[0], 'jobs_after_id': jobs_cursor[1]} if jobs_cursor else None
+    errors_next = {'errors_after_found': errors_cursor[0], 'errors_after_id': errors_cursor[1]} if errors_cursor else None
+    
+    return render_template('part_detail.html', part=part, jobs=jobs, errors=errors,
+                          job_count=counts['job_count'], error_count=counts['error_count'],
+                          jobs_next=jobs_next, errors_next=errors_next)
 
 
 # =============================================================================
@@ -1197,17 +1590,24 @@ def create_notification(user_id, notification_type, title, message, entity_type=
     ''', [user_id, notification_type, title, message, entity_type, entity_id])
 
 
+def create_notifications(user_ids, notification_type, title, message, entity_type=None, entity_id=None):
+    """Create the same notification for several users in one transaction."""
+    executemany_db('''
+        INSERT INTO notifications (user_id, notification_type, title, message, entity_type, entity_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(user_id, notification_type, title, message, entity_type, entity_id) for user_id in user_ids])
+
+
 def get_quality_notification_users():
-    """Users to notify for quality issues (QM + admin). Under development: includes admin."""
-    qm = query_db('SELECT id FROM users WHERE role = ? AND active = 1', ['quality_manager'])
-    admin = query_db('SELECT id FROM users WHERE role = ? AND active = 1', ['admin'])
-    seen = set()
-    users = []
-    for u in qm + admin:
-        if u['id'] not in seen:
-            seen.add(u['id'])
-            users.append(u)
-    return users
+    """Users to notify for quality issues (QM + admin). Under development: includes admin.
+    
+    Read fresh so a deactivated or demoted user stops being notified at once.
+    """
+    return query_db('''
+        SELECT id FROM users
+        WHERE role IN ('quality_manager', 'admin') AND active = 1
+        ORDER BY role = 'admin', id
+    ''')
 
 
 @app.route('/notifications')
@@ -1221,24 +1621,30 @@ def notifications_list():
         LIMIT 50
     ''', [current_user.id])
     
-    unread_count = query_db('''
-        SELECT COUNT(*) as count FROM notifications
-        WHERE user_id = ? AND read = 0
-    ''', [current_user.id], one=True)['count']
+    unread_count = unread_notification_count(current_user.id)
     
     return render_template('notifications.html', notifications=notifications, unread_count=unread_count)
 
 
+def unread_notification_count(user_id):
+    """Unread notifications for a user.
+    
+    Every open page polls this. It is not cached, because a per-process cache
+    would show a stale badge on other workers; idx_notifications_unread
+    answers the count from the index alone.
+    """
+    return query_db('''
+        SELECT COUNT(*) FROM notifications
+        WHERE user_id = ? AND read = 0
+    ''', [user_id], one=True)[0]
+
+
 @app.route('/notifications/count')
 @login_required
 def notifications_count():
     """Get unread notification count (for AJAX)."""
     try:
-        row = query_db('''
-            SELECT COUNT(*) as count FROM notifications
-            WHERE user_id = ? AND read = 0
-        ''', [current_user.id], one=True)
-        count = row['count'] if row else 0
+        count = unread_notification_count(current_user.id)
     except Exception:
         count = 0
     return jsonify({'count': count})
@@ -1354,7 +1760,7 @@ def admin_add_user():
         flash('Brugernavnet findes allerede.', 'error')
         return redirect(url_for('admin_users'))
     
-    password_hash = generate_password_hash(password)
+    password_hash = hash_password(password)
     execute_db('''
         INSERT INTO users (username, email, password_hash, role) 
         VALUES (?, ?, ?, ?)
@@ -1388,7 +1794,7 @@ def admin_reset_password(user_id):
         flash('Adgangskode må ikke være tom.', 'error')
         return redirect(url_for('admin_users'))
     
-    password_hash = generate_password_hash(new_password)
+    password_hash = hash_password(new_password)
     execute_db('UPDATE users SET password_hash = ? WHERE id = ?', [password_hash, user_id])
     
     user = query_db('SELECT username FROM users WHERE id = ?', [user_id], one=True)
@@ -1413,26 +1819,98 @@ def log_audit(action, entity_type, entity_id, description=None, changes=None):
 # Utility Functions
 # =============================================================================
 
-def generate_job_number():
-    """Generate next internal job number."""
-    result = query_db("SELECT MAX(CAST(SUBSTR(internal_job_number, 4) AS INTEGER)) as max_num FROM jobs WHERE internal_job_number LIKE 'JOB%'", one=True)
-    next_num = (result['max_num'] or 0) + 1
-    return f"JOB{next_num:05d}"
+def date_bounds(from_date, to_date):
+    """Return a half-open [start, end) range covering from_date through to_date.
+    
+    Comparing columns against plain values lets SQLite use range scans on
+    date indexes, and the exclusive end avoids matching the following day.
+    """
+    try:
+        end = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1)
+    except ValueError:
+        return from_date, to_date
+    return from_date, end.strftime('%Y-%m-%d')
+
+
+def to_float(value, default=None):
+    """Convert a form value to float, or default when it is empty."""
+    return float(value) if value else default
+
+
+def form_text(*names):
+    """Return the stripped text of each named form field ('' when missing)."""
+    form = request.form
+    return [form.get(name, '').strip() for name in names]
+
+
+def add_days(date_str, days):
+    """Return date_str (YYYY-MM-DD) plus days, or None if it isn't a valid date."""
+    try:
+        return (datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=int(days))).strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def keyset_page(rows, page_size, sort_key):
+    """Trim a result fetched with LIMIT page_size + 1 to one page.
+    
+    Returns the page and the (sort_key, id) cursor of its last row, or None
+    when there is no further page.
+    """
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, (rows[-1][sort_key], rows[-1]['id'])
 
 
 def calculate_exit_control_samples(lot_quantity):
     """Calculate which parts to sample: first 5 + every 10th after."""
-    samples = []
-    # First 5 parts
-    for i in range(1, min(6, lot_quantity + 1)):
-        samples.append(i)
-    # Every 10th after part 5
-    if lot_quantity > 5:
-        part = 15
-        while part <= lot_quantity:
-            samples.append(part)
-            part += 10
-    return samples
+    # First 5 parts, then every 10th after part 5 (15, 25, ...)
+    return [*range(1, min(6, lot_quantity + 1)), *range(15, lot_quantity + 1, 10)]
+
+
+# =============================================================================
+# Response Compression and Caching
+# =============================================================================
+
+GZIP_MIMETYPES = {'text/html', 'application/json', 'text/css', 'application/javascript'}
+GZIP_MIN_SIZE = 1024  # bytes; smaller bodies aren't worth the CPU
+GZIP_LEVEL = 5
+AUTOCOMPLETE_MAX_AGE = 30  # seconds
+
+
+@app.after_request
+def gzip_response(response):
+    """Gzip HTML/JSON bodies for clients that accept it.
+    
+    Streamed responses (CSV exports) and file downloads are left alone.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype not in GZIP_MIMETYPES or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    
+    data = response.get_data()
+    if len(data) < GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    # The compressed body is a different representation of the same content
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def conditional_json(payload):
+    """JSON response for autocomplete lookups: ETag, short private caching, 304 on match."""
+    response = jsonify(payload)
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.max_age = AUTOCOMPLETE_MAX_AGE
+    return response.make_conditional(request)
 
 
 # =============================================================================
@@ -1491,6 +1969,10 @@ def utility_processor():
 # Job Routes
 # =============================================================================
 
+JOBS_PAGE_SIZE = 50
+PART_DETAIL_LIMIT = 50
+
+
 @app.route('/jobs')
 @login_required
 def jobs_list():
@@ -1499,8 +1981,12 @@ def jobs_list():
     stage = request.args.get('stage', '')
     customer_id = request.args.get('customer', '')
     search = request.args.get('search', '')
+    # Keyset cursor: (created_at, id) of the last job on the previous page
+    after_created = request.args.get('after_created', '')
+    after_id = request.args.get('after_id', type=int)
     
-    # Build query
+    # Build query; the per-job counts are covering index lookups
+    # (idx_job_dimensions_job_number, idx_error_reports_job_status)
     query = '''
         SELECT j.*, c.name as customer_name,
                (SELECT COUNT(*) FROM job_dimensions WHERE job_id = j.id) as dimension_count,
@@ -1524,40 +2010,34 @@ def jobs_list():
         search_param = f'%{search}%'
         params.extend([search_param, search_param, search_param])
     
-    query += ' ORDER BY j.created_at DESC'
+    if after_created and after_id:
+        query += ' AND (j.created_at, j.id) < (?, ?)'
+        params.extend([after_created, after_id])
     
-    jobs = query_db(query, params)
+    # One extra row tells whether there is a next page
+    query += ' ORDER BY j.created_at DESC, j.id DESC LIMIT ?'
+    params.append(JOBS_PAGE_SIZE + 1)
+    
+    jobs, cursor = keyset_page(query_db(query, params), JOBS_PAGE_SIZE, 'created_at')
+    next_page = {'after_created': cursor[0], 'after_id': cursor[1]} if cursor else None
     customers = query_db('SELECT * FROM customers ORDER BY name')
     
     return render_template('jobs.html', jobs=jobs, customers=customers,
-                          current_stage=stage, current_customer=customer_id, search=search)
+                          current_stage=stage, current_customer=customer_id, search=search,
+                          next_page=next_page)
 
 
 # =============================================================================
-# Job Form API (part revisions, last setup)
+# Job Form API (part choices, last setup)
 # =============================================================================
 
-@app.route('/api/part-revisions')
-@login_required
-def api_part_revisions():
-    """Return revisions for a part number (for dropdown)."""
-    part_number = request.args.get('part_number', '').strip()
-    if not part_number:
-        return jsonify([])
+def existing_part_choices():
+    """Part number/revision pairs for the job form's part suggestions.
     
-    parts = query_db('''
-        SELECT id, part_number, part_revision, part_description
-        FROM parts
-        WHERE part_number = ?
-        ORDER BY part_revision
-    ''', [part_number])
-    
-    return jsonify([{
-        'part_id': p['id'],
-        'part_number': p['part_number'],
-        'part_revision': p['part_revision'] or '',
-        'part_description': p['part_description'] or ''
-    } for p in parts])
+    The form builds its revision dropdown from these, so they are read fresh
+    on every render rather than cached per worker.
+    """
+    return query_db('SELECT id, part_number, part_revision FROM parts ORDER BY part_number, part_revision')
 
 
 @app.route('/api/part-last-setup')
@@ -1568,27 +2048,27 @@ def api_part_last_setup():
     if not part_id:
         return jsonify(None)
     
-    # Get the most recent job for this part that has dimensions
-    job = query_db('''
-        SELECT j.id, j.internal_job_number, j.part_description, j.drawing_number, j.special_requirements
-        FROM jobs j
-        WHERE j.part_id = ?
-        ORDER BY j.created_at DESC
-        LIMIT 1
-    ''', [part_id], one=True)
+    # Most recent job for this part with its dimensions, as one row per dimension
+    rows = query_db('''
+        WITH last AS (
+            SELECT id, internal_job_number, part_description, drawing_number, special_requirements
+            FROM jobs
+            WHERE part_id = ?
+            ORDER BY created_at DESC
+            LIMIT 1
+        )
+        SELECT last.*, d.dimension_number, d.dimension_name, d.nominal_value,
+               d.tolerance_plus, d.tolerance_minus, d.unit, d.drawing_reference, d.critical
+        FROM last
+        LEFT JOIN job_dimensions d ON d.job_id = last.id
+        ORDER BY d.dimension_number
+    ''', [part_id])
     
-    if not job:
+    if not rows:
         return jsonify(None)
     
-    dimensions = query_db('''
-        SELECT dimension_number, dimension_name, nominal_value, tolerance_plus, tolerance_minus,
-               unit, drawing_reference, critical
-        FROM job_dimensions
-        WHERE job_id = ?
-        ORDER BY dimension_number
-    ''', [job['id']])
-    
-    return jsonify({
+    job = rows[0]
+    return conditional_json({
         'job_number': job['internal_job_number'],
         'part_description': job['part_description'] or '',
         'drawing_number': job['drawing_number'] or '',
@@ -1601,7 +2081,7 @@ def api_part_last_setup():
             'unit': d['unit'] or 'mm',
             'drawing_reference': d['drawing_reference'] or '',
             'critical': bool(d['critical'])
-        } for d in dimensions]
+        } for d in rows if d['dimension_number'] is not None]
     })
 
 
@@ -1611,15 +2091,13 @@ def job_create():
     """Create a new job."""
     if request.method == 'POST':
         # Get form data
-        po_number = request.form.get('po_number', '').strip()
+        (po_number, part_number, part_revision, part_description,
+         drawing_number, special_requirements) = form_text(
+            'po_number', 'part_number', 'part_revision', 'part_description',
+            'drawing_number', 'special_requirements')
         customer_id = request.form.get('customer_id') or None
-        part_number = request.form.get('part_number', '').strip()
-        part_revision = request.form.get('part_revision', '').strip()
-        part_description = request.form.get('part_description', '').strip()
         quantity = request.form.get('quantity', type=int)
         due_date = request.form.get('due_date') or None
-        drawing_number = request.form.get('drawing_number', '').strip()
-        special_requirements = request.form.get('special_requirements', '').strip()
         
         if not po_number or not part_number or not quantity:
             flash('Ordrenummer, delenummer og antal skal udfyldes.', 'error')
@@ -1628,16 +2106,16 @@ def job_create():
         # Get or create part (ensures no duplicates; new parts created automatically)
         part_id, part_was_created = get_or_create_part(part_number, part_revision, part_description)
         
-        # Generate internal job number
-        internal_job_number = generate_job_number()
-        
-        # Create job
-        job_id = execute_db('''
+        # Create job; the internal job number comes from job_counter in the same
+        # statement, and trg_jobs_job_counter advances the counter
+        job_id, internal_job_number = execute_db('''
             INSERT INTO jobs (po_number, internal_job_number, customer_id, part_id,
                             part_number, part_revision, part_description, quantity, due_date, drawing_number,
                             special_requirements)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', [po_number, internal_job_number, customer_id, part_id, part_number,
+            VALUES (?, (SELECT printf('JOB%05d', next_num) FROM job_counter WHERE id = 1),
+                    ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING id, internal_job_number
+        ''', [po_number, customer_id, part_id, part_number,
               part_revision, part_description, quantity, due_date, drawing_number,
               special_requirements])
         
@@ -1648,23 +2126,24 @@ def job_create():
         dimension_tol_minus = request.form.getlist('dimension_tol_minus[]')
         dimension_units = request.form.getlist('dimension_unit[]')
         dimension_refs = request.form.getlist('dimension_ref[]')
-        dimension_critical = request.form.getlist('dimension_critical[]')
-        
-        for i, name in enumerate(dimension_names):
-            if name.strip():
-                nominal = float(dimension_nominals[i]) if dimension_nominals[i] else 0
-                tol_plus = float(dimension_tol_plus[i]) if dimension_tol_plus[i] else None
-                tol_minus = float(dimension_tol_minus[i]) if dimension_tol_minus[i] else None
-                unit = dimension_units[i] if i < len(dimension_units) else 'mm'
-                ref = dimension_refs[i] if i < len(dimension_refs) else ''
-                critical = 1 if str(i) in dimension_critical else 0
-                
-                execute_db('''
-                    INSERT INTO job_dimensions (job_id, dimension_number, dimension_name,
-                                               nominal_value, tolerance_plus, tolerance_minus,
-                                               unit, drawing_reference, critical)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', [job_id, i + 1, name.strip(), nominal, tol_plus, tol_minus, unit, ref, critical])
+        dimension_critical = set(request.form.getlist('dimension_critical[]'))
+        
+        dimension_rows = [
+            (job_id, i + 1, name.strip(), to_float(nominal, 0), to_float(tol_plus), to_float(tol_minus),
+             'mm' if unit is None else unit, ref or '', 1 if str(i) in dimension_critical else 0)
+            for i, (name, nominal, tol_plus, tol_minus, unit, ref) in enumerate(itertools.zip_longest(
+                dimension_names, dimension_nominals, dimension_tol_plus, dimension_tol_minus,
+                dimension_units, dimension_refs))
+            if name and name.strip()
+        ]
+        
+        if dimension_rows:
+            executemany_db('''
+                INSERT INTO job_dimensions (job_id, dimension_number, dimension_name,
+                                           nominal_value, tolerance_plus, tolerance_minus,
+                                           unit, drawing_reference, critical)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', dimension_rows)
         
         log_audit('create', 'job', job_id, f'Created job {internal_job_number}')
         if part_was_created:
@@ -1675,19 +2154,18 @@ def job_create():
     
     # GET request - show form
     customers = query_db('SELECT * FROM customers ORDER BY name')
-    # Get recent jobs for copying dimensions
-    recent_jobs = query_db('''
-        SELECT id, internal_job_number, part_number, 
-               (SELECT COUNT(*) FROM job_dimensions WHERE job_id = jobs.id) as dim_count
-        FROM jobs 
-        WHERE id IN (SELECT DISTINCT job_id FROM job_dimensions)
-        ORDER BY created_at DESC 
+    # Get recent jobs for copying dimensions. Jobs are walked newest first and
+    # each check/count is a covering index seek, so this stops after 20 matches
+    recent_jobs = cached('jobs:recent_with_dimensions', JOB_FORM_CACHE_TTL, lambda: query_db('''
+        SELECT j.id, j.internal_job_number, j.part_number,
+               (SELECT COUNT(*) FROM job_dimensions WHERE job_id = j.id) as dim_count
+        FROM jobs j
+        WHERE EXISTS (SELECT 1 FROM job_dimensions WHERE job_id = j.id)
+        ORDER BY j.created_at DESC
         LIMIT 20
-    ''')
+    '''), tables=('jobs', 'job_dimensions'))
     # Get existing parts for autocomplete (new part numbers can still be typed and will be created)
-    existing_parts = query_db('''
-        SELECT part_number, part_revision FROM parts ORDER BY part_number, part_revision
-    ''')
+    existing_parts = existing_part_choices()
     
     return render_template('job_form.html', job=None, customers=customers, 
                           recent_jobs=recent_jobs, existing_parts=existing_parts, edit_mode=False)
@@ -1803,15 +2281,13 @@ def job_edit(job_id):
     
     if request.method == 'POST':
         # Update job
-        po_number = request.form.get('po_number', '').strip()
+        (po_number, part_number, part_revision, part_description,
+         drawing_number, special_requirements) = form_text(
+            'po_number', 'part_number', 'part_revision', 'part_description',
+            'drawing_number', 'special_requirements')
         customer_id = request.form.get('customer_id') or None
-        part_number = request.form.get('part_number', '').strip()
-        part_revision = request.form.get('part_revision', '').strip()
-        part_description = request.form.get('part_description', '').strip()
         quantity = request.form.get('quantity', type=int)
         due_date = request.form.get('due_date') or None
-        drawing_number = request.form.get('drawing_number', '').strip()
-        special_requirements = request.form.get('special_requirements', '').strip()
         
         # Get or create part (ensures no duplicates; new parts created automatically)
         part_id, part_was_created = get_or_create_part(part_number, part_revision, part_description)
@@ -1834,7 +2310,7 @@ def job_edit(job_id):
     
     customers = query_db('SELECT * FROM customers ORDER BY name')
     dimensions = query_db('SELECT * FROM job_dimensions WHERE job_id = ? ORDER BY dimension_number', [job_id])
-    existing_parts = query_db('SELECT part_number, part_revision FROM parts ORDER BY part_number, part_revision')
+    existing_parts = existing_part_choices()
     
     return render_template('job_form.html', job=job, customers=customers, 
                           dimensions=dimensions, existing_parts=existing_parts, edit_mode=True, recent_jobs=[])
@@ -1844,7 +2320,8 @@ def job_edit(job_id):
 @login_required
 def job_update_stage(job_id):
     """Update job workflow stage."""
-    job = query_db('SELECT * FROM jobs WHERE id = ?', [job_id], one=True)
+    # Only the previous stage is needed, for the audit entry
+    job = query_db('SELECT workflow_stage FROM jobs WHERE id = ?', [job_id], one=True)
     if not job:
         return jsonify({'error': 'Job not found'}), 404
     
@@ -1859,15 +2336,12 @@ def job_update_stage(job_id):
     old_stage = job['workflow_stage']
     
     # Update stage
-    if new_stage == 'complete':
-        execute_db('''
-            UPDATE jobs SET workflow_stage = ?, completed_at = CURRENT_TIMESTAMP, 
-                           updated_at = CURRENT_TIMESTAMP WHERE id = ?
-        ''', [new_stage, job_id])
-    else:
-        execute_db('''
-            UPDATE jobs SET workflow_stage = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
-        ''', [new_stage, job_id])
+    execute_db('''
+        UPDATE jobs SET workflow_stage = ?,
+                       completed_at = CASE WHEN ? = 'complete' THEN CURRENT_TIMESTAMP ELSE completed_at END,
+                       updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', [new_stage, new_stage, job_id])
     
     log_audit('status_change', 'job', job_id, 
               f'Changed stage from {old_stage} to {new_stage}')
@@ -1880,17 +2354,17 @@ def job_update_stage(job_id):
 @login_required
 def job_verify_revision(job_id):
     """Mark drawing revision as verified."""
-    job = query_db('SELECT * FROM jobs WHERE id = ?', [job_id], one=True)
-    if not job:
-        flash('Ordren blev ikke fundet.', 'error')
-        return redirect(url_for('jobs_list'))
-    
-    execute_db('''
+    # RETURNING tells whether the job exists, without a separate lookup
+    updated = execute_db('''
         UPDATE jobs SET revision_verified = 1, revision_verified_by = ?,
                        revision_verified_at = CURRENT_TIMESTAMP,
                        updated_at = CURRENT_TIMESTAMP
         WHERE id = ?
+        RETURNING id
     ''', [current_user.id, job_id])
+    if not updated:
+        flash('Ordren blev ikke fundet.', 'error')
+        return redirect(url_for('jobs_list'))
     
     log_audit('update', 'job', job_id, 'Verified drawing revision')
     flash('Tegningsrevision bekræftet.', 'success')
@@ -1901,14 +2375,6 @@ def job_verify_revision(job_id):
 @login_required
 def job_add_dimension(job_id):
     """Add a dimension to a job."""
-    job = query_db('SELECT * FROM jobs WHERE id = ?', [job_id], one=True)
-    if not job:
-        return jsonify({'error': 'Job not found'}), 404
-    
-    # Get next dimension number
-    result = query_db('SELECT MAX(dimension_number) as max_num FROM job_dimensions WHERE job_id = ?', [job_id], one=True)
-    next_num = (result['max_num'] or 0) + 1
-    
     name = request.form.get('dimension_name', '').strip()
     nominal = request.form.get('nominal_value', type=float) or 0
     tol_plus = request.form.get('tolerance_plus', type=float)
@@ -1921,12 +2387,20 @@ def job_add_dimension(job_id):
         flash('Dimensionsnavn skal udfyldes.', 'error')
         return redirect(url_for('job_detail', job_id=job_id))
     
-    execute_db('''
+    # Numbers the dimension after the job's last one; inserts nothing if the job doesn't exist
+    added = execute_db('''
         INSERT INTO job_dimensions (job_id, dimension_number, dimension_name,
                                    nominal_value, tolerance_plus, tolerance_minus,
                                    unit, drawing_reference, critical)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', [job_id, next_num, name, nominal, tol_plus, tol_minus, unit, ref, critical])
+        SELECT j.id, COALESCE(MAX(d.dimension_number), 0) + 1, ?, ?, ?, ?, ?, ?, ?
+        FROM jobs j
+        LEFT JOIN job_dimensions d ON d.job_id = j.id
+        WHERE j.id = ?
+        GROUP BY j.id
+        RETURNING id
+    ''', [name, nominal, tol_plus, tol_minus, unit, ref, critical, job_id])
+    if not added:
+        return jsonify({'error': 'Job not found'}), 404
     
     flash('Dimension tilføjet.', 'success')
     return redirect(url_for('job_detail', job_id=job_id))
@@ -1945,28 +2419,31 @@ def job_delete_dimension(job_id, dim_id):
 @login_required
 def job_copy_dimensions(job_id, source_job_id):
     """Copy dimensions from another job."""
-    # Get source dimensions
-    source_dims = query_db('SELECT * FROM job_dimensions WHERE job_id = ? ORDER BY dimension_number', [source_job_id])
+    if source_job_id == job_id:
+        # Copying a job onto itself leaves its dimensions unchanged
+        return redirect(url_for('job_detail', job_id=job_id))
     
-    if not source_dims:
+    copied = query_db('SELECT COUNT(*) AS count FROM job_dimensions WHERE job_id = ?',
+                      [source_job_id], one=True)['count']
+    if not copied:
         flash('Kildeordren har ingen dimensioner.', 'error')
         return redirect(url_for('job_detail', job_id=job_id))
     
-    # Delete existing dimensions
-    execute_db('DELETE FROM job_dimensions WHERE job_id = ?', [job_id])
-    
-    # Copy dimensions
-    for dim in source_dims:
+    # Replace existing dimensions and copy in one transaction, inside SQLite
+    with db_transaction():
+        execute_db('DELETE FROM job_dimensions WHERE job_id = ?', [job_id])
         execute_db('''
             INSERT INTO job_dimensions (job_id, dimension_number, dimension_name,
                                        nominal_value, tolerance_plus, tolerance_minus,
                                        unit, drawing_reference, critical)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', [job_id, dim['dimension_number'], dim['dimension_name'],
-              dim['nominal_value'], dim['tolerance_plus'], dim['tolerance_minus'],
-              dim['unit'], dim['drawing_reference'], dim['critical']])
-    
-    flash(f'{len(source_dims)} dimensioner kopieret fra kildeordren.', 'success')
+            SELECT ?, dimension_number, dimension_name,
+                   nominal_value, tolerance_plus, tolerance_minus,
+                   unit, drawing_reference, critical
+            FROM job_dimensions WHERE job_id = ?
+            ORDER BY dimension_number
+        ''', [job_id, source_job_id])
+    
+    flash(f'{copied} dimensioner kopieret fra kildeordren.', 'success')
     return redirect(url_for('job_detail', job_id=job_id))
 
 
@@ -1974,18 +2451,144 @@ def job_copy_dimensions(job_id, source_job_id):
 # Document Upload Routes
 # =============================================================================
 
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 
+ALLOWED_SUFFIXES = tuple('.' + ext for ext in ALLOWED_EXTENSIONS)
+
+
 def allowed_file(filename):
     """Check if file extension is allowed."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(ALLOWED_SUFFIXES)
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    """Send oversized uploads back to the form instead of a bare 413 page.
+    
+    Werkzeug raises this from the Content-Length header before the body is
+    read, so the rejected file is never spooled to disk.
+    """
+    max_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    flash(f'Filen er for stor (maks. {max_mb} MB).', 'error')
+    referrer = request.referrer
+    # Only go back to pages on this site; the Referer header is client-supplied
+    if not referrer or urlparse(referrer).netloc != request.host:
+        referrer = url_for('index')
+    return redirect(referrer)
+
+
+# Attachment file_type by extension; anything else is stored as 'other'
+ATTACHMENT_FILE_TYPES = {'png': 'image', 'jpg': 'image', 'jpeg': 'image', 'gif': 'image', 'pdf': 'pdf'}
+
+
+def attachment_file_type(filename):
+    """Classify an attachment as 'image', 'pdf' or 'other' by its extension."""
+    return ATTACHMENT_FILE_TYPES.get(os.path.splitext(filename)[1][1:].lower(), 'other')
+
+
+UPLOAD_SUBDIRS = ['drawings', 'photos', 'certificates', 'documents']
+# Uploads are copied to disk in 1 MiB chunks (Werkzeug's FileStorage.save default is 16 KiB)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+_upload_dirs_ready = False
+
+
+def ensure_upload_dirs():
+    """Create the upload directories on first use rather than at import."""
+    global _upload_dirs_ready
+    if _upload_dirs_ready:
+        return
+    for subdir in UPLOAD_SUBDIRS:
+        os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], subdir), exist_ok=True)
+    _upload_dirs_ready = True
+
+
+_reap_queue = queue.Queue()
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def _reap_uploads():
+    while True:
+        full_path = _reap_queue.get()
+        try:
+            os.remove(full_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Could not remove upload {full_path}: {e}")
+
+
+def remove_upload(file_path):
+    """Remove an uploaded file in a background thread.
+    
+    Callers delete the database row first, so the file is already unreachable
+    and the request doesn't have to wait on the filesystem.
+    """
+    global _reaper
+    with _reaper_lock:
+        if _reaper is None:
+            _reaper = threading.Thread(target=_reap_uploads, name='upload-reaper', daemon=True)
+            _reaper.start()
+    _reap_queue.put(os.path.join(app.config['UPLOAD_FOLDER'], file_path))
+
+
+def save_upload(file, full_path):
+    """Save an uploaded file to full_path through a temporary '.part' file.
+    
+    The file only appears under its final name once it is complete, so an
+    interrupted upload never leaves a truncated file behind.
+    """
+    part_path = full_path + '.part'
+    try:
+        file.save(part_path, buffer_size=UPLOAD_CHUNK_SIZE)
+    except Exception:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    os.replace(part_path, full_path)
+
+
+def save_deduplicated(file, file_path):
+    """Save an uploaded file under file_path and return its SHA-256 hex digest.
+    
+    When an attachment with the same content already exists, the new path is
+    hard-linked to that file so the bytes are only stored once. Each row still
+    owns its own path, so deleting one attachment leaves the others intact.
+    """
+    full_path = os.path.join(app.config['UPLOAD_FOLDER'], file_path)
+    part_path = full_path + '.part'
+    digest = hashlib.sha256()
+    try:
+        with open(part_path, 'wb') as out:
+            for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+    except Exception:
+        # open() itself may have failed, leaving nothing to clean up
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    os.replace(part_path, full_path)
+    sha256 = digest.hexdigest()
+    
+    existing = query_db('SELECT file_path FROM attachments WHERE sha256 = ? LIMIT 1', [sha256], one=True)
+    if existing:
+        link_path = full_path + '.link'
+        try:
+            os.link(os.path.join(app.config['UPLOAD_FOLDER'], existing['file_path']), link_path)
+            os.replace(link_path, full_path)
+        except OSError:
+            # Missing original or no hard link support; keep the copy just written
+            pass
+    return sha256
 
 
 @app.route('/jobs/<int:job_id>/documents', methods=['POST'])
 @login_required
 def job_upload_document(job_id):
     """Upload a document to a job."""
-    job = query_db('SELECT * FROM jobs WHERE id = ?', [job_id], one=True)
+    job = query_db('SELECT internal_job_number FROM jobs WHERE id = ?', [job_id], one=True)
     if not job:
         flash('Ordren blev ikke fundet.', 'error')
         return redirect(url_for('jobs_list'))
@@ -2010,7 +2613,8 @@ def job_upload_document(job_id):
         
         file_path = os.path.join(subdir, filename)
         full_path = os.path.join(app.config['UPLOAD_FOLDER'], file_path)
-        file.save(full_path)
+        ensure_upload_dirs()
+        save_upload(file, full_path)
         
         revision = request.form.get('revision', '')
         
@@ -2031,14 +2635,9 @@ def job_upload_document(job_id):
 @login_required
 def delete_document(doc_id):
     """Delete a document."""
-    doc = query_db('SELECT * FROM job_documents WHERE id = ?', [doc_id], one=True)
+    doc = execute_db('DELETE FROM job_documents WHERE id = ? RETURNING job_id, file_path', [doc_id])
     if doc:
-        # Delete file
-        full_path = os.path.join(app.config['UPLOAD_FOLDER'], doc['file_path'])
-        if os.path.exists(full_path):
-            os.remove(full_path)
-        
-        execute_db('DELETE FROM job_documents WHERE id = ?', [doc_id])
+        remove_upload(doc['file_path'])
         flash('Dokument slettet.', 'success')
         return redirect(url_for('job_detail', job_id=doc['job_id']))
     
@@ -2055,9 +2654,11 @@ def delete_document(doc_id):
 def customers_list():
     """List all customers."""
     customers = query_db('''
-        SELECT c.*, 
-               (SELECT COUNT(*) FROM jobs WHERE customer_id = c.id) as job_count
+        SELECT c.*, COALESCE(j.job_count, 0) as job_count
         FROM customers c
+        LEFT JOIN (
+            SELECT customer_id, COUNT(*) as job_count FROM jobs GROUP BY customer_id
+        ) j ON j.customer_id = c.id
         ORDER BY c.name
     ''')
     return render_template('customers.html', customers=customers)
@@ -2067,11 +2668,8 @@ def customers_list():
 @login_required
 def customer_add():
     """Add a new customer."""
-    name = request.form.get('name', '').strip()
-    contact_person = request.form.get('contact_person', '').strip()
-    email = request.form.get('email', '').strip()
-    phone = request.form.get('phone', '').strip()
-    notes = request.form.get('notes', '').strip()
+    name, contact_person, email, phone, notes = form_text(
+        'name', 'contact_person', 'email', 'phone', 'notes')
     
     if not name:
         flash('Kundenavn skal udfyldes.', 'error')
@@ -2090,11 +2688,8 @@ def customer_add():
 @login_required
 def customer_edit(customer_id):
     """Edit a customer."""
-    name = request.form.get('name', '').strip()
-    contact_person = request.form.get('contact_person', '').strip()
-    email = request.form.get('email', '').strip()
-    phone = request.form.get('phone', '').strip()
-    notes = request.form.get('notes', '').strip()
+    name, contact_person, email, phone, notes = form_text(
+        'name', 'contact_person', 'email', 'phone', 'notes')
     
     if not name:
         flash('Kundenavn skal udfyldes.', 'error')
@@ -2119,11 +2714,21 @@ def suppliers_list():
     """List all suppliers."""
     suppliers = query_db('''
         SELECT s.*,
-               (SELECT COUNT(*) FROM material_controls WHERE supplier_id = s.id) as material_count,
-               (SELECT COUNT(*) FROM external_processes WHERE supplier_id = s.id) as process_count,
-               (SELECT COUNT(*) FROM error_reports WHERE supplier_id = s.id) as error_count,
-               (SELECT COUNT(*) FROM error_reports WHERE supplier_id = s.id AND status = 'open') as open_error_count
+               COALESCE(mc.material_count, 0) as material_count,
+               COALESCE(ep.process_count, 0) as process_count,
+               COALESCE(er.error_count, 0) as error_count,
+               COALESCE(er.open_error_count, 0) as open_error_count
         FROM suppliers s
+        LEFT JOIN (
+            SELECT supplier_id, COUNT(*) as material_count FROM material_controls GROUP BY supplier_id
+        ) mc ON mc.supplier_id = s.id
+        LEFT JOIN (
+            SELECT supplier_id, COUNT(*) as process_count FROM external_processes GROUP BY supplier_id
+        ) ep ON ep.supplier_id = s.id
+        LEFT JOIN (
+            SELECT supplier_id, COUNT(*) as error_count, SUM(status = 'open') as open_error_count
+            FROM error_reports GROUP BY supplier_id
+        ) er ON er.supplier_id = s.id
         WHERE s.active = 1
         ORDER BY s.name
     ''')
@@ -2134,13 +2739,9 @@ def suppliers_list():
 @login_required
 def supplier_add():
     """Add a new supplier."""
-    name = request.form.get('name', '').strip()
+    name, contact_person, email, phone, processes_offered, notes = form_text(
+        'name', 'contact_person', 'email', 'phone', 'processes_offered', 'notes')
     supplier_type = request.form.get('supplier_type', 'material')
-    contact_person = request.form.get('contact_person', '').strip()
-    email = request.form.get('email', '').strip()
-    phone = request.form.get('phone', '').strip()
-    processes_offered = request.form.get('processes_offered', '').strip()
-    notes = request.form.get('notes', '').strip()
     
     if not name:
         flash('Leverandørnavn skal udfyldes.', 'error')
@@ -2159,13 +2760,9 @@ def supplier_add():
 @login_required
 def supplier_edit(supplier_id):
     """Edit a supplier."""
-    name = request.form.get('name', '').strip()
+    name, contact_person, email, phone, processes_offered, notes = form_text(
+        'name', 'contact_person', 'email', 'phone', 'processes_offered', 'notes')
     supplier_type = request.form.get('supplier_type', 'material')
-    contact_person = request.form.get('contact_person', '').strip()
-    email = request.form.get('email', '').strip()
-    phone = request.form.get('phone', '').strip()
-    processes_offered = request.form.get('processes_offered', '').strip()
-    notes = request.form.get('notes', '').strip()
     
     if not name:
         flash('Leverandørnavn skal udfyldes.', 'error')
@@ -2194,6 +2791,23 @@ def supplier_delete(supplier_id):
 # Material Control Routes
 # =============================================================================
 
+def material_suppliers():
+    """Active suppliers that can deliver material, for the supplier dropdown."""
+    return query_db(
+        "SELECT * FROM suppliers WHERE active = 1 AND supplier_type IN ('material', 'both') ORDER BY name"
+    )
+
+
+def material_control_job(mc):
+    """The job header material_control.html shows, taken from mc's joined job columns."""
+    return {
+        'id': mc['job_id'],
+        'internal_job_number': mc['internal_job_number'],
+        'po_number': mc['po_number'],
+        'part_number': mc['part_number'],
+    }
+
+
 @app.route('/jobs/<int:job_id>/material/new', methods=['GET', 'POST'])
 @login_required
 def material_control_create(job_id):
@@ -2204,36 +2818,37 @@ def material_control_create(job_id):
         return redirect(url_for('jobs_list'))
     
     if request.method == 'POST':
-        material_type = request.form.get('material_type', '').strip()
-        supplier_id = request.form.get('supplier_id') or None
-        batch_number = request.form.get('batch_number', '').strip()
-        quantity_received = request.form.get('quantity_received', '').strip()
-        certificate_matches = 1 if request.form.get('certificate_matches') else 0
-        visual_ok = 1 if request.form.get('visual_ok') else 0
-        dimensions_ok = 1 if request.form.get('dimensions_ok') else 0 if request.form.get('dimensions_checked') else None
-        notes = request.form.get('notes', '').strip()
-        status = request.form.get('status', 'pending')
+        form = request.form
+        material_type, batch_number, quantity_received, notes = form_text(
+            'material_type', 'batch_number', 'quantity_received', 'notes')
+        supplier_id = form.get('supplier_id') or None
+        certificate_matches = 1 if form.get('certificate_matches') else 0
+        visual_ok = 1 if form.get('visual_ok') else 0
+        dimensions_ok = 1 if form.get('dimensions_ok') else 0 if form.get('dimensions_checked') else None
+        status = form.get('status', 'pending')
         
         if not material_type:
             flash('Materialetype skal udfyldes.', 'error')
             return redirect(url_for('material_control_create', job_id=job_id))
         
-        mc_id = execute_db('''
-            INSERT INTO material_controls (job_id, inspector_id, material_type, supplier_id,
-                                          batch_number, quantity_received, certificate_matches,
-                                          visual_ok, dimensions_ok, status, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', [job_id, current_user.id, material_type, supplier_id, batch_number,
-              quantity_received, certificate_matches, visual_ok, dimensions_ok, status, notes])
-        
-        log_audit('create', 'material_control', mc_id, 
-                 f'Created material control for job {job["internal_job_number"]}')
+        # The record and its audit entry commit together
+        with db_transaction():
+            mc_id = execute_db('''
+                INSERT INTO material_controls (job_id, inspector_id, material_type, supplier_id,
+                                              batch_number, quantity_received, certificate_matches,
+                                              visual_ok, dimensions_ok, status, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [job_id, current_user.id, material_type, supplier_id, batch_number,
+                  quantity_received, certificate_matches, visual_ok, dimensions_ok, status, notes])
+            
+            log_audit('create', 'material_control', mc_id, 
+                     f'Created material control for job {job["internal_job_number"]}')
         
         flash('Materialekontrol oprettet.', 'success')
         return redirect(url_for('material_control_detail', mc_id=mc_id))
     
     # GET request
-    suppliers = query_db("SELECT * FROM suppliers WHERE active = 1 AND supplier_type IN ('material', 'both') ORDER BY name")
+    suppliers = material_suppliers()
     return render_template('material_control.html', job=job, mc=None, suppliers=suppliers, 
                           attachments=None, edit_mode=False, view_mode=False)
 
@@ -2265,8 +2880,8 @@ def material_control_detail(mc_id):
         ORDER BY a.uploaded_at DESC
     ''', [mc_id])
     
-    job = query_db('SELECT * FROM jobs WHERE id = ?', [mc['job_id']], one=True)
-    suppliers = query_db("SELECT * FROM suppliers WHERE active = 1 AND supplier_type IN ('material', 'both') ORDER BY name")
+    job = material_control_job(mc)
+    suppliers = material_suppliers()
     
     return render_template('material_control.html', job=job, mc=mc, suppliers=suppliers,
                           attachments=attachments, edit_mode=False, view_mode=True)
@@ -2277,7 +2892,7 @@ def material_control_detail(mc_id):
 def material_control_edit(mc_id):
     """Edit a material control record."""
     mc = query_db('''
-        SELECT mc.*, j.id as job_id, j.internal_job_number
+        SELECT mc.*, j.id as job_id, j.internal_job_number, j.po_number, j.part_number
         FROM material_controls mc
         JOIN jobs j ON mc.job_id = j.id
         WHERE mc.id = ?
@@ -2288,15 +2903,14 @@ def material_control_edit(mc_id):
         return redirect(url_for('jobs_list'))
     
     if request.method == 'POST':
-        material_type = request.form.get('material_type', '').strip()
-        supplier_id = request.form.get('supplier_id') or None
-        batch_number = request.form.get('batch_number', '').strip()
-        quantity_received = request.form.get('quantity_received', '').strip()
-        certificate_matches = 1 if request.form.get('certificate_matches') else 0
-        visual_ok = 1 if request.form.get('visual_ok') else 0
-        dimensions_ok = 1 if request.form.get('dimensions_ok') else 0 if request.form.get('dimensions_checked') else None
-        notes = request.form.get('notes', '').strip()
-        status = request.form.get('status', 'pending')
+        form = request.form
+        material_type, batch_number, quantity_received, notes = form_text(
+            'material_type', 'batch_number', 'quantity_received', 'notes')
+        supplier_id = form.get('supplier_id') or None
+        certificate_matches = 1 if form.get('certificate_matches') else 0
+        visual_ok = 1 if form.get('visual_ok') else 0
+        dimensions_ok = 1 if form.get('dimensions_ok') else 0 if form.get('dimensions_checked') else None
+        status = form.get('status', 'pending')
         
         execute_db('''
             UPDATE material_controls SET material_type = ?, supplier_id = ?, batch_number = ?,
@@ -2309,8 +2923,8 @@ def material_control_edit(mc_id):
         flash('Materialekontrol opdateret.', 'success')
         return redirect(url_for('material_control_detail', mc_id=mc_id))
     
-    job = query_db('SELECT * FROM jobs WHERE id = ?', [mc['job_id']], one=True)
-    suppliers = query_db("SELECT * FROM suppliers WHERE active = 1 AND supplier_type IN ('material', 'both') ORDER BY name")
+    job = material_control_job(mc)
+    suppliers = material_suppliers()
     attachments = query_db('''
         SELECT * FROM attachments WHERE entity_type = 'material_control' AND entity_id = ?
     ''', [mc_id])
@@ -2323,30 +2937,36 @@ def material_control_edit(mc_id):
 @login_required
 def material_control_status(mc_id):
     """Update material control status (approve/reject)."""
-    mc = query_db('SELECT * FROM material_controls WHERE id = ?', [mc_id], one=True)
+    # Existence check and the job fields for the notification in one query
+    mc = query_db('''
+        SELECT mc.job_id, j.po_number, j.part_number, j.internal_job_number
+        FROM material_controls mc
+        JOIN jobs j ON mc.job_id = j.id
+        WHERE mc.id = ?
+    ''', [mc_id], one=True)
     if not mc:
         flash('Materialekontrol blev ikke fundet.', 'error')
         return redirect(url_for('jobs_list'))
     
     new_status = request.form.get('status')
-    if new_status in ['pending', 'approved', 'rejected']:
-        execute_db('UPDATE material_controls SET status = ?, inspector_id = ? WHERE id = ?',
-                  [new_status, current_user.id, mc_id])
-        flash(f'Materialestatus opdateret til {new_status}.', 'success')
-        
-        # Notify QM + Admin when material is rejected
-        if new_status == 'rejected':
-            job = query_db('SELECT po_number, part_number, internal_job_number FROM jobs WHERE id = ?', [mc['job_id']], one=True)
-            if job:
-                for u in get_quality_notification_users():
-                    create_notification(
-                        u['id'],
-                        'material_rejected',
-                        f'Material Rejected: {job["part_number"]}',
-                        f'Material control for Job {job["internal_job_number"]} (PO {job["po_number"]}) was rejected.',
-                        'material_control',
-                        mc_id
-                    )
+    if new_status not in ['pending', 'approved', 'rejected']:
+        flash('Ugyldig materialestatus.', 'error')
+        return redirect(url_for('material_control_detail', mc_id=mc_id))
+    
+    execute_db('UPDATE material_controls SET status = ?, inspector_id = ? WHERE id = ?',
+               [new_status, current_user.id, mc_id])
+    flash(f'Materialestatus opdateret til {new_status}.', 'success')
+    
+    # Notify QM + Admin when material is rejected
+    if new_status == 'rejected':
+        create_notifications(
+            [u['id'] for u in get_quality_notification_users()],
+            'material_rejected',
+            f'Material Rejected: {mc["part_number"]}',
+            f'Material control for Job {mc["internal_job_number"]} (PO {mc["po_number"]}) was rejected.',
+            'material_control',
+            mc_id
+        )
     
     return redirect(url_for('material_control_detail', mc_id=mc_id))
 
@@ -2355,7 +2975,7 @@ def material_control_status(mc_id):
 @login_required
 def material_control_upload(mc_id):
     """Upload a material certificate."""
-    mc = query_db('SELECT * FROM material_controls WHERE id = ?', [mc_id], one=True)
+    mc = query_db('SELECT id FROM material_controls WHERE id = ?', [mc_id], one=True)
     if not mc:
         flash('Materialekontrol blev ikke fundet.', 'error')
         return redirect(url_for('jobs_list'))
@@ -2371,20 +2991,19 @@ def material_control_upload(mc_id):
     
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"MC{mc_id}_{timestamp}_{filename}"
+        # Random tag rather than a timestamp: two uploads in the same second can't collide
+        filename = f"MC{mc_id}_{secrets.token_hex(4)}_{filename}"
         
         file_path = os.path.join('certificates', filename)
-        full_path = os.path.join(app.config['UPLOAD_FOLDER'], file_path)
-        file.save(full_path)
+        ensure_upload_dirs()
+        sha256 = save_deduplicated(file, file_path)
         
-        ext = filename.rsplit('.', 1)[1].lower()
-        file_type = 'image' if ext in ['png', 'jpg', 'jpeg', 'gif'] else 'pdf' if ext == 'pdf' else 'other'
+        file_type = attachment_file_type(filename)
         
         execute_db('''
-            INSERT INTO attachments (entity_type, entity_id, file_name, file_path, file_type, uploaded_by)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', ['material_control', mc_id, file.filename, file_path, file_type, current_user.id])
+            INSERT INTO attachments (entity_type, entity_id, file_name, file_path, file_type, uploaded_by, sha256)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', ['material_control', mc_id, file.filename, file_path, file_type, current_user.id, sha256])
         
         flash('Materialecertifikat uploadet.', 'success')
     else:
@@ -2397,13 +3016,12 @@ def material_control_upload(mc_id):
 @login_required
 def material_attachment_delete(mc_id, attachment_id):
     """Delete an attachment from material control."""
-    attachment = query_db('SELECT * FROM attachments WHERE id = ? AND entity_type = ? AND entity_id = ?',
-                         [attachment_id, 'material_control', mc_id], one=True)
+    attachment = execute_db('''
+        DELETE FROM attachments WHERE id = ? AND entity_type = ? AND entity_id = ?
+        RETURNING file_path
+    ''', [attachment_id, 'material_control', mc_id])
     if attachment:
-        full_path = os.path.join(app.config['UPLOAD_FOLDER'], attachment['file_path'])
-        if os.path.exists(full_path):
-            os.remove(full_path)
-        execute_db('DELETE FROM attachments WHERE id = ?', [attachment_id])
+        remove_upload(attachment['file_path'])
         flash('Vedhæftning slettet.', 'success')
     
     return redirect(url_for('material_control_detail', mc_id=mc_id))
@@ -2413,6 +3031,21 @@ def material_attachment_delete(mc_id, attachment_id):
 # Supplier Error Reports
 # =============================================================================
 
+SUPPLIER_ERRORS_PAGE_SIZE = 50
+
+
+def supplier_filter_choices():
+    """Active suppliers for the supplier error filter."""
+    return query_db('SELECT id, name, supplier_type FROM suppliers WHERE active = 1 ORDER BY name')
+
+
+def job_part_numbers():
+    """Distinct part numbers used on jobs, for the part filter."""
+    # DISTINCT comes straight off idx_jobs_part_number
+    return query_db(
+        'SELECT DISTINCT part_number FROM jobs WHERE part_number IS NOT NULL AND part_number != "" ORDER BY part_number'
+    )
+
 @app.route('/suppliers/<int:supplier_id>/errors')
 @login_required
 def supplier_error_history(supplier_id):
@@ -2422,22 +3055,38 @@ def supplier_error_history(supplier_id):
         flash('Leverandør blev ikke fundet.', 'error')
         return redirect(url_for('suppliers_list'))
     
-    errors = query_db('''
-        SELECT er.*, j.internal_job_number as job_number, j.part_number, u.username as reported_by_name
+    after_found = request.args.get('after_found', '')
+    after_id = request.args.get('after_id', type=int)
+    
+    query = '''
+        SELECT er.id, er.job_id, er.found_date, er.severity, er.description, er.status,
+               j.internal_job_number as job_number, j.part_number as part_name
         FROM error_reports er
         JOIN jobs j ON er.job_id = j.id
-        LEFT JOIN users u ON er.reported_by = u.id
         WHERE er.supplier_id = ?
-        ORDER BY er.found_date DESC
-    ''', [supplier_id])
-    
-    # Stats
-    total = len(errors)
-    open_count = len([e for e in errors if e['status'] == 'open'])
-    resolved_count = len([e for e in errors if e['status'] == 'resolved'])
+    '''
+    params = [supplier_id]
+    if after_found and after_id:
+        query += ' AND (er.found_date, er.id) < (?, ?)'
+        params.extend([after_found, after_id])
+    query += ' ORDER BY er.found_date DESC, er.id DESC LIMIT ?'
+    params.append(SUPPLIER_ERRORS_PAGE_SIZE + 1)
+    
+    errors, cursor = keyset_page(query_db(query, params), SUPPLIER_ERRORS_PAGE_SIZE, 'found_date')
+    next_page = {'after_found': cursor[0], 'after_id': cursor[1]} if cursor else None
+    
+    # Stats (counted from the supplier/status index)
+    stats = query_db('''
+        SELECT COUNT(*) as total,
+               COALESCE(SUM(status = 'open'), 0) as open_count,
+               COALESCE(SUM(status = 'resolved'), 0) as resolved_count
+        FROM error_reports
+        WHERE supplier_id = ?
+    ''', [supplier_id], one=True)
     
     return render_template('supplier_errors.html', supplier=supplier, errors=errors,
-                         total=total, open_count=open_count, resolved_count=resolved_count)
+                         total=stats['total'], open_count=stats['open_count'],
+                         resolved_count=stats['resolved_count'], next_page=next_page)
 
 
 @app.route('/supplier-errors')
@@ -2447,46 +3096,61 @@ def all_supplier_errors():
     error_type = request.args.get('type', '')  # 'material' or 'external'
     status = request.args.get('status', '')
     part = request.args.get('part', '')
+    after_found = request.args.get('after_found', '')
+    after_id = request.args.get('after_id', type=int)
     
-    query = '''
-        SELECT er.*, j.internal_job_number as job_number, j.part_number, j.part_revision,
-               s.name as supplier_name, s.supplier_type,
-               u.username as reported_by_name
-        FROM error_reports er
-        JOIN jobs j ON er.job_id = j.id
-        LEFT JOIN suppliers s ON er.supplier_id = s.id
-        LEFT JOIN users u ON er.reported_by = u.id
-        WHERE er.supplier_id IS NOT NULL
-    '''
-    params = []
+    filters = ' WHERE er.supplier_id IS NOT NULL'
+    filter_params = []
     
     if error_type == 'material':
-        query += ' AND er.error_type = ?'
-        params.append('material_supplier')
+        filters += ' AND er.error_type = ?'
+        filter_params.append('material_supplier')
     elif error_type == 'external':
-        query += ' AND er.error_type = ?'
-        params.append('external_supplier')
+        filters += ' AND er.error_type = ?'
+        filter_params.append('external_supplier')
     
     if status:
-        query += ' AND er.status = ?'
-        params.append(status)
+        filters += ' AND er.status = ?'
+        filter_params.append(status)
     
     if part:
-        query += ' AND j.part_number = ?'
-        params.append(part)
+        filters += ' AND j.part_number = ?'
+        filter_params.append(part)
     
-    query += ' ORDER BY er.found_date DESC'
+    # Per-supplier totals over every matching error, not just the page shown
+    supplier_counts = {row['supplier_id']: row for row in query_db('''
+        SELECT er.supplier_id, COUNT(*) as error_count, SUM(er.status = 'open') as open_count
+        FROM error_reports er
+        JOIN jobs j ON er.job_id = j.id
+    ''' + filters + ' GROUP BY er.supplier_id', filter_params)}
+    total = sum(row['error_count'] for row in supplier_counts.values())
     
-    errors = query_db(query, params)
+    query = '''
+        SELECT er.id, er.job_id, er.supplier_id, er.error_type, er.found_date, er.severity,
+               er.description, er.status,
+               j.internal_job_number as job_number, j.part_number, j.part_revision,
+               s.name as supplier_name
+        FROM error_reports er
+        JOIN jobs j ON er.job_id = j.id
+        LEFT JOIN suppliers s ON er.supplier_id = s.id
+    ''' + filters
+    params = list(filter_params)
+    if after_found and after_id:
+        query += ' AND (er.found_date, er.id) < (?, ?)'
+        params.extend([after_found, after_id])
+    query += ' ORDER BY er.found_date DESC, er.id DESC LIMIT ?'
+    params.append(SUPPLIER_ERRORS_PAGE_SIZE + 1)
     
-    # Get suppliers for filter dropdown
-    suppliers = query_db('SELECT id, name, supplier_type FROM suppliers WHERE active = 1 ORDER BY name')
+    errors, cursor = keyset_page(query_db(query, params), SUPPLIER_ERRORS_PAGE_SIZE, 'found_date')
+    next_page = {'after_found': cursor[0], 'after_id': cursor[1]} if cursor else None
     
-    # Get unique part numbers for filter
-    parts = query_db('SELECT DISTINCT part_number FROM jobs WHERE part_number IS NOT NULL AND part_number != "" ORDER BY part_number')
+    # Filter dropdowns
+    suppliers = supplier_filter_choices()
+    parts = job_part_numbers()
     
     return render_template('all_supplier_errors.html', errors=errors, suppliers=suppliers, parts=parts,
-                         filter_type=error_type, filter_status=status, filter_part=part)
+                         filter_type=error_type, filter_status=status, filter_part=part,
+                         supplier_counts=supplier_counts, total=total, next_page=next_page)
 
 
 @app.route('/quality-by-part')
@@ -2550,41 +3214,41 @@ def quality_by_part():
         revisions = query_db('''
             SELECT p.part_revision, 
                    COUNT(DISTINCT j.id) as job_count,
-                   (SELECT COUNT(*) FROM error_reports er 
-                    JOIN jobs j2 ON er.job_id = j2.id 
-                    JOIN parts p2 ON j2.part_id = p2.id
-                    WHERE p2.part_number = ? AND p2.part_revision = p.part_revision) as error_count
+                   COUNT(er.id) as error_count
             FROM parts p
             LEFT JOIN jobs j ON j.part_id = p.id
+            LEFT JOIN error_reports er ON er.job_id = j.id
             WHERE p.part_number = ?
             GROUP BY p.part_revision
             ORDER BY p.part_revision DESC
-        ''', [part['part_number'], part['part_number']])
+        ''', [part['part_number']])
         
         return render_template('quality_by_part.html', part=part, part_number=part['part_number'], 
                              part_revision=part['part_revision'], errors=errors, jobs=jobs, revisions=revisions)
     
     # Show summary of all parts with error counts (from parts table)
-    parts = query_db('''
+    parts = cached('quality:parts_summary', REPORTS_CACHE_TTL, lambda: query_db('''
+        WITH part_errors AS (
+            SELECT p.part_number, COUNT(*) as error_count,
+                   SUM(er.status = 'open') as open_error_count
+            FROM error_reports er
+            JOIN jobs j ON er.job_id = j.id
+            JOIN parts p ON j.part_id = p.id
+            GROUP BY p.part_number
+        )
         SELECT p.id, p.part_number, p.part_revision, p.part_description,
-               COUNT(DISTINCT j.id) as job_count,
-               COUNT(DISTINCT p2.id) as revision_count,
-               (SELECT COUNT(*) FROM error_reports er 
-                JOIN jobs j2 ON er.job_id = j2.id 
-                JOIN parts p3 ON j2.part_id = p3.id
-                WHERE p3.part_number = p.part_number) as error_count,
-               (SELECT COUNT(*) FROM error_reports er 
-                JOIN jobs j2 ON er.job_id = j2.id 
-                JOIN parts p3 ON j2.part_id = p3.id
-                WHERE p3.part_number = p.part_number AND er.status = 'open') as open_error_count,
+               COUNT(j.id) as job_count,
+               COUNT(DISTINCT p.id) as revision_count,
+               COALESCE(pe.error_count, 0) as error_count,
+               COALESCE(pe.open_error_count, 0) as open_error_count,
                MAX(j.created_at) as last_used
         FROM parts p
         LEFT JOIN jobs j ON j.part_id = p.id
-        LEFT JOIN parts p2 ON p2.part_number = p.part_number
+        LEFT JOIN part_errors pe ON pe.part_number = p.part_number
         WHERE p.part_number IS NOT NULL AND p.part_number != ''
         GROUP BY p.part_number
         ORDER BY error_count DESC, p.part_number
-    ''')
+    '''), tables=('parts', 'jobs', 'error_reports'))
     
     return render_template('quality_by_part.html', parts=parts)
 
@@ -2621,17 +3285,16 @@ def internal_error_report(job_id):
         ''', [job_id, current_user.id, workflow_stage, severity, description, affected_quantity])
         
         # Notify Quality Managers + Admin
-        for u in get_quality_notification_users():
-            create_notification(
-                u['id'],
-                'error_report',
-                f'Internal Quality Issue: {job["part_number"]}',
-                f'Internal issue reported for Job {job["internal_job_number"]} (PO {job["po_number"]}). Severity: {severity}',
-                'error_report',
-                error_id
-            )
+        create_notifications(
+            [u['id'] for u in get_quality_notification_users()],
+            'error_report',
+            f'Internal Quality Issue: {job["part_number"]}',
+            f'Internal issue reported for Job {job["internal_job_number"]} (PO {job["po_number"]}). Severity: {severity}',
+            'error_report',
+            error_id
+        )
         
-        log_audit(current_user.id, 'error_report', error_id, 'created', f'Internal error for job {job["internal_job_number"]}')
+        log_audit('create', 'error_report', error_id, f'Internal error for job {job["internal_job_number"]}')
         flash('Intern kvalitetsrapport oprettet. Admin og kvalitetsansvarlig er notificeret.', 'success')
         return redirect(url_for('error_report_detail', error_id=error_id))
     
@@ -2643,7 +3306,8 @@ def internal_error_report(job_id):
 def material_error_report(mc_id):
     """Create an error report for material from a supplier."""
     mc = query_db('''
-        SELECT mc.*, s.name as supplier_name, j.internal_job_number as job_number, j.part_number as part_name
+        SELECT mc.*, s.name as supplier_name, j.internal_job_number as job_number, j.part_number as part_name,
+               j.po_number as job_po_number
         FROM material_controls mc
         LEFT JOIN suppliers s ON mc.supplier_id = s.id
         JOIN jobs j ON mc.job_id = j.id
@@ -2655,38 +3319,38 @@ def material_error_report(mc_id):
         return redirect(url_for('jobs_list'))
     
     if request.method == 'POST':
-        error_id = execute_db('''
-            INSERT INTO error_reports (job_id, reported_by, workflow_stage, severity, description,
-                                      affected_quantity, error_type, supplier_id, material_control_id, status)
-            VALUES (?, ?, 'material_control', ?, ?, ?, 'material_supplier', ?, ?, 'open')
-        ''', [
-            mc['job_id'],
-            current_user.id,
-            request.form['severity'],
-            request.form['description'],
-            request.form.get('affected_quantity') or None,
-            mc['supplier_id'],
-            mc_id
-        ])
-        
-        # Notify Quality Managers + Admin (under development)
-        job = query_db('SELECT po_number, part_number FROM jobs WHERE id = ?', [mc['job_id']], one=True)
-        for u in get_quality_notification_users():
-            create_notification(
-                u['id'],
+        # Report, notifications, status change and audit entry commit together
+        with db_transaction():
+            error_id = execute_db('''
+                INSERT INTO error_reports (job_id, reported_by, workflow_stage, severity, description,
+                                          affected_quantity, error_type, supplier_id, material_control_id, status)
+                VALUES (?, ?, 'material_control', ?, ?, ?, 'material_supplier', ?, ?, 'open')
+            ''', [
+                mc['job_id'],
+                current_user.id,
+                request.form['severity'],
+                request.form['description'],
+                request.form.get('affected_quantity') or None,
+                mc['supplier_id'],
+                mc_id
+            ])
+            
+            # Notify Quality Managers + Admin (under development)
+            create_notifications(
+                [u['id'] for u in get_quality_notification_users()],
                 'error_report',
-                f'New Quality Issue: {job["part_number"]}',
-                f'Material supplier issue reported for PO {job["po_number"]}. Severity: {request.form["severity"]}',
+                f'New Quality Issue: {mc["part_name"]}',
+                f'Material supplier issue reported for PO {mc["job_po_number"]}. Severity: {request.form["severity"]}',
                 'error_report',
                 error_id
             )
-        
-        # Update material control status to rejected if not already
-        if mc['status'] != 'rejected':
-            execute_db('UPDATE material_controls SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
-                      ['rejected', mc_id])
-        
-        log_audit(current_user.id, 'error_report', error_id, 'created', f'Material supplier error for MC#{mc_id}')
+            
+            # Update material control status to rejected if not already
+            if mc['status'] != 'rejected':
+                execute_db('UPDATE material_controls SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                          ['rejected', mc_id])
+            
+            log_audit('create', 'error_report', error_id, f'Material supplier error for MC#{mc_id}')
         flash('Leverandørfejlrapport oprettet.', 'success')
         return redirect(url_for('error_report_detail', error_id=error_id))
     
@@ -2698,7 +3362,8 @@ def material_error_report(mc_id):
 def external_error_report(ep_id):
     """Create an error report for external process supplier."""
     ep = query_db('''
-        SELECT ep.*, s.name as supplier_name, j.internal_job_number as job_number, j.part_number as part_name
+        SELECT ep.*, s.name as supplier_name, j.internal_job_number as job_number, j.part_number as part_name,
+               j.po_number as job_po_number
         FROM external_processes ep
         LEFT JOIN suppliers s ON ep.supplier_id = s.id
         JOIN jobs j ON ep.job_id = j.id
@@ -2710,38 +3375,38 @@ def external_error_report(ep_id):
         return redirect(url_for('jobs_list'))
     
     if request.method == 'POST':
-        error_id = execute_db('''
-            INSERT INTO error_reports (job_id, reported_by, workflow_stage, severity, description,
-                                      affected_quantity, error_type, supplier_id, external_process_id, status)
-            VALUES (?, ?, 'external_process', ?, ?, ?, 'external_supplier', ?, ?, 'open')
-        ''', [
-            ep['job_id'],
-            current_user.id,
-            request.form['severity'],
-            request.form['description'],
-            request.form.get('affected_quantity') or None,
-            ep['supplier_id'],
-            ep_id
-        ])
-        
-        # Notify Quality Managers + Admin (under development)
-        job = query_db('SELECT po_number, part_number FROM jobs WHERE id = ?', [ep['job_id']], one=True)
-        for u in get_quality_notification_users():
-            create_notification(
-                u['id'],
+        # Report, notifications, status change and audit entry commit together
+        with db_transaction():
+            error_id = execute_db('''
+                INSERT INTO error_reports (job_id, reported_by, workflow_stage, severity, description,
+                                          affected_quantity, error_type, supplier_id, external_process_id, status)
+                VALUES (?, ?, 'external_process', ?, ?, ?, 'external_supplier', ?, ?, 'open')
+            ''', [
+                ep['job_id'],
+                current_user.id,
+                request.form['severity'],
+                request.form['description'],
+                request.form.get('affected_quantity') or None,
+                ep['supplier_id'],
+                ep_id
+            ])
+            
+            # Notify Quality Managers + Admin (under development)
+            create_notifications(
+                [u['id'] for u in get_quality_notification_users()],
                 'error_report',
-                f'New Quality Issue: {job["part_number"]}',
-                f'External process supplier issue reported for PO {job["po_number"]}. Severity: {request.form["severity"]}',
+                f'New Quality Issue: {ep["part_name"]}',
+                f'External process supplier issue reported for PO {ep["job_po_number"]}. Severity: {request.form["severity"]}',
                 'error_report',
                 error_id
             )
-        
-        # Update external process status to rejected if not already
-        if ep['status'] != 'rejected':
-            execute_db('UPDATE external_processes SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
-                      ['rejected', ep_id])
-        
-        log_audit(current_user.id, 'error_report', error_id, 'created', f'External supplier error for EP#{ep_id}')
+            
+            # Update external process status to rejected if not already
+            if ep['status'] != 'rejected':
+                execute_db('UPDATE external_processes SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                          ['rejected', ep_id])
+            
+            log_audit('create', 'error_report', error_id, f'External supplier error for EP#{ep_id}')
         flash('Leverandørfejlrapport oprettet.', 'success')
         return redirect(url_for('error_report_detail', error_id=error_id))
     
@@ -2829,7 +3494,7 @@ def error_report_update(error_id):
         ''', [error_id])
         flash('Fejlrapport genåbnet.', 'success')
     
-    log_audit(current_user.id, 'error_report', error_id, action, f'Error report {action}')
+    log_audit('status_change', 'error_report', error_id, f'Error report {action}')
     return redirect(url_for('error_report_detail', error_id=error_id))
 
 
@@ -2858,7 +3523,8 @@ def error_report_upload(error_id):
         
         upload_path = os.path.join('photos', filename)
         full_path = os.path.join(app.config['UPLOAD_FOLDER'], upload_path)
-        file.save(full_path)
+        ensure_upload_dirs()
+        save_upload(file, full_path)
         
         execute_db('''
             INSERT INTO attachments (entity_type, entity_id, file_path, file_name, file_type, uploaded_by)
@@ -2877,6 +3543,16 @@ def error_report_upload(error_id):
 # External Process Routes
 # =============================================================================
 
+def external_process_job(ep):
+    """The job header external_process.html shows, taken from ep's joined job columns."""
+    return {
+        'id': ep['job_id'],
+        'job_number': ep['job_number'],
+        'po_number': ep['job_po'],
+        'part_number': ep['part_number'],
+    }
+
+
 @app.route('/jobs/<int:job_id>/external-process/new', methods=['GET', 'POST'])
 @login_required
 def external_process_create(job_id):
@@ -2905,7 +3581,7 @@ def external_process_create(job_id):
             current_user.id
         ])
         
-        log_audit(current_user.id, 'external_process', ep_id, 'created', f'External process for job {job["job_number"]}')
+        log_audit('create', 'external_process', ep_id, f'External process for job {job["job_number"]}')
         flash('Ekstern proces oprettet.', 'success')
         return redirect(url_for('external_process_detail', ep_id=ep_id))
     
@@ -2931,7 +3607,7 @@ def external_process_detail(ep_id):
         flash('Ekstern proces blev ikke fundet.', 'error')
         return redirect(url_for('jobs_list'))
     
-    job = query_db('SELECT * FROM jobs WHERE id = ?', [ep['job_id']], one=True)
+    job = external_process_job(ep)
     attachments = query_db('''
         SELECT a.*, u.username as uploaded_by_username
         FROM attachments a
@@ -2951,12 +3627,17 @@ def external_process_detail(ep_id):
 @login_required
 def external_process_edit(ep_id):
     """Edit external process record."""
-    ep = query_db('SELECT * FROM external_processes WHERE id = ?', [ep_id], one=True)
+    ep = query_db('''
+        SELECT ep.*, j.internal_job_number as job_number, j.part_number, j.po_number as job_po
+        FROM external_processes ep
+        JOIN jobs j ON ep.job_id = j.id
+        WHERE ep.id = ?
+    ''', [ep_id], one=True)
     if not ep:
         flash('Ekstern proces blev ikke fundet.', 'error')
         return redirect(url_for('jobs_list'))
     
-    job = query_db('SELECT * FROM jobs WHERE id = ?', [ep['job_id']], one=True)
+    job = external_process_job(ep)
     suppliers = query_db("SELECT * FROM suppliers WHERE active = 1 AND (supplier_type = 'external' OR supplier_type = 'both') ORDER BY name")
     
     if request.method == 'POST':
@@ -2976,7 +3657,7 @@ def external_process_edit(ep_id):
             ep_id
         ])
         
-        log_audit(current_user.id, 'external_process', ep_id, 'updated', 'External process updated')
+        log_audit('update', 'external_process', ep_id, 'External process updated')
         flash('Ekstern proces opdateret.', 'success')
         return redirect(url_for('external_process_detail', ep_id=ep_id))
     
@@ -3017,23 +3698,23 @@ def external_process_inspect(ep_id):
     
     status = request.form.get('status')  # 'approved' or 'rejected'
     
-    execute_db('''
-        UPDATE external_processes SET
-            status = ?,
-            inspected_by = ?,
-            inspection_date = CURRENT_TIMESTAMP,
-            inspection_notes = ?,
-            updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', [status, current_user.id, request.form.get('inspection_notes'), ep_id])
-    
-    # Notify QM + Admin when external process is rejected
-    if status == 'rejected':
-        job = query_db('SELECT po_number, part_number, internal_job_number FROM jobs WHERE id = ?', [ep['job_id']], one=True)
-        if job:
-            for u in get_quality_notification_users():
-                create_notification(
-                    u['id'],
+    with db_transaction():
+        execute_db('''
+            UPDATE external_processes SET
+                status = ?,
+                inspected_by = ?,
+                inspection_date = CURRENT_TIMESTAMP,
+                inspection_notes = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', [status, current_user.id, request.form.get('inspection_notes'), ep_id])
+        
+        # Notify QM + Admin when external process is rejected
+        if status == 'rejected':
+            job = query_db('SELECT po_number, part_number, internal_job_number FROM jobs WHERE id = ?', [ep['job_id']], one=True)
+            if job:
+                create_notifications(
+                    [u['id'] for u in get_quality_notification_users()],
                     'external_rejected',
                     f'External Process Rejected: {job["part_number"]}',
                     f'External process for Job {job["internal_job_number"]} (PO {job["po_number"]}) was rejected after inspection.',
@@ -3068,10 +3749,11 @@ def external_process_upload(ep_id):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
         filename = timestamp + filename
         
-        file_type = 'image' if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')) else 'pdf'
+        file_type = attachment_file_type(filename)
         upload_path = os.path.join('certificates', filename)
         full_path = os.path.join(app.config['UPLOAD_FOLDER'], upload_path)
-        file.save(full_path)
+        ensure_upload_dirs()
+        save_upload(file, full_path)
         
         execute_db('''
             INSERT INTO attachments (entity_type, entity_id, file_path, file_name, file_type, uploaded_by)
@@ -3101,30 +3783,39 @@ def exit_control_create(job_id):
     if request.method == 'POST':
         lot_quantity = request.form.get('lot_quantity', type=int) or job['quantity']
         
-        # Create exit control record
-        ec_id = execute_db('''
-            INSERT INTO exit_controls (job_id, inspector_id, lot_quantity, overall_status, notes)
-            VALUES (?, ?, ?, 'in_progress', ?)
-        ''', [job_id, current_user.id, lot_quantity, request.form.get('notes', '')])
+        with db_transaction():
+            # Create exit control record
+            ec_id = execute_db('''
+                INSERT INTO exit_controls (job_id, inspector_id, lot_quantity, overall_status, notes)
+                VALUES (?, ?, ?, 'in_progress', ?)
+            ''', [job_id, current_user.id, lot_quantity, request.form.get('notes', '')])
         
-        # Calculate and create sample records
-        samples = calculate_exit_control_samples(lot_quantity)
-        for part_num in samples:
-            execute_db('''
+            # Calculate and create sample records
+            samples = calculate_exit_control_samples(lot_quantity)
+            executemany_db('''
                 INSERT INTO exit_control_samples (exit_control_id, part_number)
                 VALUES (?, ?)
-            ''', [ec_id, part_num])
+            ''', [(ec_id, part_num) for part_num in samples])
         
-        log_audit(current_user.id, 'exit_control', ec_id, 'created', 
-                 f'Exit control for job {job["internal_job_number"]}, {len(samples)} samples')
+            log_audit('create', 'exit_control', ec_id, 
+                     f'Exit control for job {job["internal_job_number"]}, {len(samples)} samples')
         flash(f'Slutkontrol oprettet med {len(samples)} prøver at inspicere.', 'success')
         return redirect(url_for('exit_control_detail', ec_id=ec_id))
     
-    # Calculate preview of samples
-    preview_samples = calculate_exit_control_samples(job['quantity'])
-    
-    return render_template('exit_control.html', job=job, ec=None, 
-                         preview_samples=preview_samples, view_mode=False)
+    # The sampling plan preview is drawn in the browser from the lot quantity
+    return render_template('exit_control.html', job=job, ec=None, view_mode=False)
+
+
+def exit_control_job(ec):
+    """The job header exit_control.html shows, taken from ec's joined job columns."""
+    return {
+        'id': ec['job_id'],
+        'internal_job_number': ec['job_number'],
+        'po_number': ec['po_number'],
+        'part_number': ec['part_number'],
+        'part_revision': ec['part_revision'],
+        'quantity': ec['job_quantity'],
+    }
 
 
 @app.route('/exit-control/<int:ec_id>')
@@ -3144,7 +3835,7 @@ def exit_control_detail(ec_id):
         flash('Slutkontrol blev ikke fundet.', 'error')
         return redirect(url_for('jobs_list'))
     
-    job = query_db('SELECT * FROM jobs WHERE id = ?', [ec['job_id']], one=True)
+    job = exit_control_job(ec)
     
     # Get all samples
     samples = query_db('''
@@ -3153,11 +3844,12 @@ def exit_control_detail(ec_id):
         ORDER BY part_number
     ''', [ec_id])
     
-    # Calculate stats
+    # Calculate stats in one pass over the rows already loaded
+    results = Counter(s['overall_pass'] for s in samples)
     total_samples = len(samples)
-    inspected = len([s for s in samples if s['overall_pass'] is not None])
-    passed = len([s for s in samples if s['overall_pass'] == 1])
-    failed = len([s for s in samples if s['overall_pass'] == 0])
+    inspected = total_samples - results[None]
+    passed = results[1]
+    failed = results[0]
     
     return render_template('exit_control.html', job=job, ec=ec, samples=samples,
                          total_samples=total_samples, inspected=inspected,
@@ -3179,26 +3871,30 @@ def exit_control_record_sample(ec_id, sample_id):
     surface_ok = 1 if request.form.get('surface_ok') else 0
     overall_pass = 1 if (dimensions_ok and visual_ok and surface_ok) else 0
     
-    execute_db('''
-        UPDATE exit_control_samples SET
-            dimensions_ok = ?, visual_ok = ?, surface_ok = ?,
-            overall_pass = ?, notes = ?, inspected_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', [dimensions_ok, visual_ok, surface_ok, overall_pass, 
-          request.form.get('notes', ''), sample_id])
-    
-    # Check if all samples are inspected and update overall status
-    samples = query_db('SELECT * FROM exit_control_samples WHERE exit_control_id = ?', [ec_id])
-    all_inspected = all(s['overall_pass'] is not None for s in samples)
-    
-    if all_inspected:
-        all_passed = all(s['overall_pass'] == 1 for s in samples)
-        status = 'passed' if all_passed else 'failed'
-        execute_db('UPDATE exit_controls SET overall_status = ? WHERE id = ?', [status, ec_id])
+    with db_transaction():
+        execute_db('''
+            UPDATE exit_control_samples SET
+                dimensions_ok = ?, visual_ok = ?, surface_ok = ?,
+                overall_pass = ?, notes = ?, inspected_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', [dimensions_ok, visual_ok, surface_ok, overall_pass, 
+              request.form.get('notes', ''), sample_id])
+        
+        # Once every sample is inspected, set the overall status from the sample counts
+        ec = execute_db('''
+            UPDATE exit_controls
+            SET overall_status = CASE WHEN counts.not_passed = 0 THEN 'passed' ELSE 'failed' END
+            FROM (
+                SELECT SUM(overall_pass IS NULL) as pending, SUM(overall_pass IS NOT 1) as not_passed
+                FROM exit_control_samples
+                WHERE exit_control_id = ?
+            ) AS counts
+            WHERE exit_controls.id = ? AND counts.pending = 0
+            RETURNING job_id, overall_status
+        ''', [ec_id, ec_id])
         
         # Update job stage if passed
-        if all_passed:
-            ec = query_db('SELECT job_id FROM exit_controls WHERE id = ?', [ec_id], one=True)
+        if ec and ec['overall_status'] == 'passed':
             execute_db('''
                 UPDATE jobs SET workflow_stage = 'complete', completed_at = CURRENT_TIMESTAMP 
                 WHERE id = ? AND workflow_stage = 'exit_control'
@@ -3209,6 +3905,16 @@ def exit_control_record_sample(ec_id, sample_id):
     return redirect(url_for('exit_control_detail', ec_id=ec_id))
 
 
+def exit_control_sample_counts(ec_id):
+    """Count an exit control's uninspected samples and samples that didn't pass."""
+    return query_db('''
+        SELECT COALESCE(SUM(overall_pass IS NULL), 0) as pending,
+               COALESCE(SUM(overall_pass IS NOT 1), 0) as not_passed
+        FROM exit_control_samples
+        WHERE exit_control_id = ?
+    ''', [ec_id], one=True)
+
+
 @app.route('/exit-control/<int:ec_id>/complete', methods=['POST'])
 @login_required
 def exit_control_complete(ec_id):
@@ -3219,15 +3925,14 @@ def exit_control_complete(ec_id):
         return redirect(url_for('jobs_list'))
     
     # Check all samples inspected
-    samples = query_db('SELECT * FROM exit_control_samples WHERE exit_control_id = ?', [ec_id])
-    uninspected = [s for s in samples if s['overall_pass'] is None]
+    counts = exit_control_sample_counts(ec_id)
     
-    if uninspected:
-        flash(f'{len(uninspected)} prøver mangler endnu inspektion.', 'error')
+    if counts['pending']:
+        flash(f'{counts["pending"]} prøver mangler endnu inspektion.', 'error')
         return redirect(url_for('exit_control_detail', ec_id=ec_id))
     
     # Determine overall result
-    all_passed = all(s['overall_pass'] == 1 for s in samples)
+    all_passed = not counts['not_passed']
     status = 'passed' if all_passed else 'failed'
     
     execute_db('UPDATE exit_controls SET overall_status = ? WHERE id = ?', [status, ec_id])
@@ -3241,7 +3946,7 @@ def exit_control_complete(ec_id):
     else:
         flash('Slutkontrol ikke bestået. Gennemgå fejlede prøver og opret fejlrapporter.', 'warning')
     
-    log_audit(current_user.id, 'exit_control', ec_id, 'completed', f'Status: {status}')
+    log_audit('status_change', 'exit_control', ec_id, f'Status: {status}')
     return redirect(url_for('exit_control_detail', ec_id=ec_id))
 
 
@@ -3259,24 +3964,28 @@ def exit_control_add_samples(ec_id):
         flash('Ingen delenumre angivet.', 'error')
         return redirect(url_for('exit_control_detail', ec_id=ec_id))
     
-    added = 0
+    new_parts = set()
+    invalid = []
     for num in part_numbers.replace(',', ' ').split():
         try:
-            part_num = int(num.strip())
-            # Check if already exists
-            existing = query_db('''
-                SELECT id FROM exit_control_samples 
-                WHERE exit_control_id = ? AND part_number = ?
-            ''', [ec_id, part_num], one=True)
-            
-            if not existing and 1 <= part_num <= ec['lot_quantity']:
-                execute_db('''
-                    INSERT INTO exit_control_samples (exit_control_id, part_number)
-                    VALUES (?, ?)
-                ''', [ec_id, part_num])
-                added += 1
+            part_num = int(num)
         except ValueError:
+            invalid.append(num)
             continue
+        if 1 <= part_num <= ec['lot_quantity']:
+            new_parts.add(part_num)
+        else:
+            invalid.append(num)
+    
+    if invalid:
+        flash(f'Ignorerede ugyldige delenumre: {", ".join(invalid)}', 'warning')
+    
+    # One batch; parts that already have a sample hit the unique index and are skipped
+    added = executemany_db('''
+        INSERT INTO exit_control_samples (exit_control_id, part_number)
+        VALUES (?, ?)
+        ON CONFLICT (exit_control_id, part_number) DO NOTHING
+    ''', [(ec_id, part_num) for part_num in sorted(new_parts)]) if new_parts else 0
     
     if added:
         flash(f'{added} ekstra prøve(r) tilføjet.', 'success')
@@ -3290,6 +3999,11 @@ def exit_control_add_samples(ec_id):
 # Measurement Report Routes
 # =============================================================================
 
+def active_equipment():
+    """Active measuring equipment, for the measurement report equipment dropdowns."""
+    return query_db('SELECT * FROM equipment WHERE active = 1 ORDER BY name')
+
+
 @app.route('/jobs/<int:job_id>/measurements/new', methods=['GET', 'POST'])
 @login_required
 def measurement_report_create(job_id):
@@ -3310,14 +4024,9 @@ def measurement_report_create(job_id):
         report_type = request.form.get('report_type', 'in_process')
         notes = request.form.get('notes', '').strip()
         
-        # Create the report
-        report_id = execute_db('''
-            INSERT INTO measurement_reports (job_id, report_type, inspector_id, notes)
-            VALUES (?, ?, ?, ?)
-        ''', [job_id, report_type, current_user.id, notes])
-        
         # Process measurements
         overall_pass = True
+        measurement_rows = []
         for dim in dimensions:
             actual_value_str = request.form.get(f'actual_{dim["id"]}', '').strip()
             if actual_value_str:
@@ -3333,35 +4042,39 @@ def measurement_report_create(job_id):
                     sample_num = request.form.get(f'sample_{dim["id"]}', 1, type=int)
                     measurement_notes = request.form.get(f'notes_{dim["id"]}', '').strip()
                     
-                    execute_db('''
-                        INSERT INTO measurements (report_id, job_dimension_id, actual_value, 
-                                                 pass_fail, equipment_id, sample_number, 
-                                                 measured_by, notes)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', [report_id, dim['id'], actual_value, pass_fail, equipment_id, 
-                          sample_num, current_user.id, measurement_notes])
+                    measurement_rows.append((dim['id'], actual_value, pass_fail, equipment_id,
+                                             sample_num, current_user.id, measurement_notes))
                 except ValueError:
                     pass  # Skip invalid values
         
-        # Update overall status
+        # Overall status; pending if no measurements were recorded
         overall_status = 'pass' if overall_pass else 'fail'
-        # Check if any measurements were recorded
-        measurement_count = query_db('SELECT COUNT(*) as count FROM measurements WHERE report_id = ?', 
-                                    [report_id], one=True)['count']
-        if measurement_count == 0:
+        if not measurement_rows:
             overall_status = 'pending'
         
-        execute_db('UPDATE measurement_reports SET overall_status = ? WHERE id = ?', 
-                  [overall_status, report_id])
-        
-        log_audit('create', 'measurement_report', report_id, 
-                 f'Created {report_type} measurement report for job {job["internal_job_number"]}')
+        # Report, measurements and audit entry are committed together
+        with db_transaction():
+            report_id = execute_db('''
+                INSERT INTO measurement_reports (job_id, report_type, inspector_id, notes, overall_status)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [job_id, report_type, current_user.id, notes, overall_status])
+            
+            if measurement_rows:
+                executemany_db('''
+                    INSERT INTO measurements (report_id, job_dimension_id, actual_value, 
+                                             pass_fail, equipment_id, sample_number, 
+                                             measured_by, notes)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(report_id,) + row for row in measurement_rows])
+            
+            log_audit('create', 'measurement_report', report_id, 
+                     f'Created {report_type} measurement report for job {job["internal_job_number"]}')
         
         flash('Målerapport oprettet.', 'success')
         return redirect(url_for('measurement_report_detail', report_id=report_id))
     
     # GET request - show form
-    equipment = query_db('SELECT * FROM equipment WHERE active = 1 ORDER BY name')
+    equipment = active_equipment()
     return render_template('measurement_report.html', job=job, dimensions=dimensions, 
                           equipment=equipment, report=None, measurements=None, edit_mode=False)
 
@@ -3428,19 +4141,30 @@ def measurement_report_detail(report_id):
     ''', [report_id])
     
     job = query_db('SELECT * FROM jobs WHERE id = ?', [report['job_id']], one=True)
-    equipment = query_db('SELECT * FROM equipment WHERE active = 1 ORDER BY name')
+    equipment = active_equipment()
     
     return render_template('measurement_report.html', job=job, report=report, 
                           dimensions=dimensions, attachments=attachments,
                           equipment=equipment, edit_mode=False, view_mode=True)
 
 
+def measurement_report_job(report):
+    """The job header measurement_report.html shows, taken from report's joined job columns."""
+    return {
+        'id': report['job_id'],
+        'internal_job_number': report['internal_job_number'],
+        'po_number': report['po_number'],
+        'part_number': report['part_number'],
+        'quantity': report['quantity'],
+    }
+
+
 @app.route('/measurements/<int:report_id>/edit', methods=['GET', 'POST'])
 @login_required
 def measurement_report_edit(report_id):
     """Edit a measurement report - add or update measurements."""
     report = query_db('''
-        SELECT mr.*, j.internal_job_number, j.id as job_id
+        SELECT mr.*, j.internal_job_number, j.po_number, j.part_number, j.quantity
         FROM measurement_reports mr
         JOIN jobs j ON mr.job_id = j.id
         WHERE mr.id = ?
@@ -3450,80 +4174,76 @@ def measurement_report_edit(report_id):
         flash('Målerapport blev ikke fundet.', 'error')
         return redirect(url_for('jobs_list'))
     
-    job = query_db('SELECT * FROM jobs WHERE id = ?', [report['job_id']], one=True)
-    dimensions = query_db('SELECT * FROM job_dimensions WHERE job_id = ? ORDER BY dimension_number', 
-                         [report['job_id']])
+    job = measurement_report_job(report)
     
     if request.method == 'POST':
         notes = request.form.get('notes', '').strip()
-        
-        # Update report notes
-        execute_db('UPDATE measurement_reports SET notes = ? WHERE id = ?', [notes, report_id])
+        dimensions = query_db('SELECT * FROM job_dimensions WHERE job_id = ? ORDER BY dimension_number', 
+                             [report['job_id']])
         
         # Process measurements
-        overall_pass = True
-        has_measurements = False
+        measurement_rows = []
         
         for dim in dimensions:
             actual_value_str = request.form.get(f'actual_{dim["id"]}', '').strip()
             if actual_value_str:
-                has_measurements = True
                 try:
                     actual_value = float(actual_value_str)
                     pass_fail = calculate_pass_fail(dim, actual_value)
-                    if pass_fail == 'fail':
-                        overall_pass = False
                     
                     equipment_id = request.form.get(f'equipment_{dim["id"]}') or None
                     sample_num = request.form.get(f'sample_{dim["id"]}', 1, type=int)
                     measurement_notes = request.form.get(f'notes_{dim["id"]}', '').strip()
                     
-                    # Check if measurement exists for this dimension
-                    existing = query_db('''
-                        SELECT id FROM measurements 
-                        WHERE report_id = ? AND job_dimension_id = ? AND sample_number = ?
-                    ''', [report_id, dim['id'], sample_num], one=True)
-                    
-                    if existing:
-                        execute_db('''
-                            UPDATE measurements SET actual_value = ?, pass_fail = ?, 
-                                   equipment_id = ?, notes = ?, measured_by = ?, 
-                                   measured_at = CURRENT_TIMESTAMP
-                            WHERE id = ?
-                        ''', [actual_value, pass_fail, equipment_id, measurement_notes, 
-                              current_user.id, existing['id']])
-                    else:
-                        execute_db('''
-                            INSERT INTO measurements (report_id, job_dimension_id, actual_value, 
-                                                     pass_fail, equipment_id, sample_number, 
-                                                     measured_by, notes)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', [report_id, dim['id'], actual_value, pass_fail, equipment_id, 
-                              sample_num, current_user.id, measurement_notes])
+                    measurement_rows.append((report_id, dim['id'], actual_value, pass_fail, equipment_id,
+                                             sample_num, current_user.id, measurement_notes))
                 except ValueError:
                     pass
         
-        # Update overall status
-        if has_measurements:
-            overall_status = 'pass' if overall_pass else 'fail'
-        else:
-            overall_status = 'pending'
-        
-        execute_db('UPDATE measurement_reports SET overall_status = ? WHERE id = ?', 
-                  [overall_status, report_id])
+        with db_transaction():
+            # A measurement already recorded for the dimension and sample is updated in place
+            if measurement_rows:
+                executemany_db('''
+                    INSERT INTO measurements (report_id, job_dimension_id, actual_value, 
+                                             pass_fail, equipment_id, sample_number, 
+                                             measured_by, notes)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (report_id, job_dimension_id, sample_number) DO UPDATE SET
+                        actual_value = excluded.actual_value, pass_fail = excluded.pass_fail,
+                        equipment_id = excluded.equipment_id, notes = excluded.notes,
+                        measured_by = excluded.measured_by, measured_at = CURRENT_TIMESTAMP
+                ''', measurement_rows)
+            # Overall status from every measurement the report now holds
+            execute_db('''
+                UPDATE measurement_reports SET notes = ?, overall_status = (
+                    SELECT CASE WHEN COUNT(*) = 0 THEN 'pending'
+                                WHEN SUM(pass_fail = 'fail') > 0 THEN 'fail'
+                                ELSE 'pass' END
+                    FROM measurements WHERE report_id = ?
+                )
+                WHERE id = ?
+            ''', [notes, report_id, report_id])
         
         flash('Målerapport opdateret.', 'success')
         return redirect(url_for('measurement_report_detail', report_id=report_id))
     
-    # GET - get existing measurements
+    # GET - dimensions with their existing measurements in one query
+    rows = query_db('''
+        SELECT jd.*, m.id as measurement_id, m.actual_value, m.equipment_id, m.sample_number
+        FROM job_dimensions jd
+        LEFT JOIN measurements m ON m.job_dimension_id = jd.id AND m.report_id = ?
+        WHERE jd.job_id = ?
+        ORDER BY jd.dimension_number, jd.id, m.sample_number
+    ''', [report_id, report['job_id']])
+    dimensions = {}
     measurements = {}
-    existing_measurements = query_db('''
-        SELECT * FROM measurements WHERE report_id = ?
-    ''', [report_id])
-    for m in existing_measurements:
-        measurements[m['job_dimension_id']] = dict(m)
+    for row in rows:
+        dimensions.setdefault(row['id'], row)
+        if row['measurement_id'] is not None:
+            measurements[row['id']] = row
+    dimensions = list(dimensions.values())
     
-    equipment = query_db('SELECT * FROM equipment WHERE active = 1 ORDER BY name')
+    equipment = active_equipment()
     
     return render_template('measurement_report.html', job=job, report=report,
                           dimensions=dimensions, measurements=measurements,
@@ -3534,7 +4254,7 @@ def measurement_report_edit(report_id):
 @login_required
 def measurement_report_upload(report_id):
     """Upload a scanned measurement sheet to a report."""
-    report = query_db('SELECT * FROM measurement_reports WHERE id = ?', [report_id], one=True)
+    report = query_db('SELECT id FROM measurement_reports WHERE id = ?', [report_id], one=True)
     if not report:
         flash('Målerapport blev ikke fundet.', 'error')
         return redirect(url_for('jobs_list'))
@@ -3555,11 +4275,11 @@ def measurement_report_upload(report_id):
         
         file_path = os.path.join('photos', filename)
         full_path = os.path.join(app.config['UPLOAD_FOLDER'], file_path)
-        file.save(full_path)
+        ensure_upload_dirs()
+        save_upload(file, full_path)
         
         # Determine file type
-        ext = filename.rsplit('.', 1)[1].lower()
-        file_type = 'image' if ext in ['png', 'jpg', 'jpeg', 'gif'] else 'pdf' if ext == 'pdf' else 'other'
+        file_type = attachment_file_type(filename)
         
         execute_db('''
             INSERT INTO attachments (entity_type, entity_id, file_name, file_path, file_type, uploaded_by)
@@ -3577,13 +4297,12 @@ def measurement_report_upload(report_id):
 @login_required
 def measurement_attachment_delete(report_id, attachment_id):
     """Delete an attachment from a measurement report."""
-    attachment = query_db('SELECT * FROM attachments WHERE id = ? AND entity_type = ? AND entity_id = ?',
-                         [attachment_id, 'measurement_report', report_id], one=True)
+    attachment = execute_db('''
+        DELETE FROM attachments WHERE id = ? AND entity_type = ? AND entity_id = ?
+        RETURNING file_path
+    ''', [attachment_id, 'measurement_report', report_id])
     if attachment:
-        full_path = os.path.join(app.config['UPLOAD_FOLDER'], attachment['file_path'])
-        if os.path.exists(full_path):
-            os.remove(full_path)
-        execute_db('DELETE FROM attachments WHERE id = ?', [attachment_id])
+        remove_upload(attachment['file_path'])
         flash('Vedhæftning slettet.', 'success')
     
     return redirect(url_for('measurement_report_detail', report_id=report_id))
@@ -3621,7 +4340,7 @@ def create_admin_command():
         print('Admin user already exists.')
         return
     
-    password_hash = generate_password_hash('admin')
+    password_hash = hash_password('admin')
     execute_db('''
         INSERT INTO users (username, email, password_hash, role) 
         VALUES (?, ?, ?, ?)
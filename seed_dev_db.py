@@ -7,43 +7,48 @@ Run with: python seed_dev_db.py
 import sqlite3
 import os
 from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'qa.db')
 
+# generate_password_hash() output for the sample passwords, computed once so
+# seeding does no key derivation
+SAMPLE_PASSWORD_HASHES = {
+    'admin': 'scrypt:32768:8:1$Wa96hDxzWhkxzyg5$f03b95f6919523eafe7ab0f3e1f6a31b634e0a6ce8051f22242b35b5f4a1dc0695cd2411668defcea3640afdfea8c7ff29f3a398f7d1ba18962b0f9632408a07',
+    'inspector1': 'scrypt:32768:8:1$1EoTrbHlfA4zNhOk$abf4484ab45a1943d53e4bc449081e40bbe10e7655f9c5f8426faf8e66992c3d813c498f75f53f8df7f990f87a2dc574150af125efbacd0fb69875f2b5f324af',
+    'operator1': 'scrypt:32768:8:1$xlwuyyQoS99611Rp$418bf412665f03d8d19d04a17e3765488da425a378bca2235fd12ad7cff1c8da738f2aaaf7cd4453cdf89ec1bb3c32f867491442d89e5baf992038cc93846a48',
+    'qm': 'scrypt:32768:8:1$MVG9qGCbzHuwj9SE$24742a33570f7d3bebc872883caa7a0a7ca013118bdc162e4bc91c2a511b0314b14e107b9d6a44930b6ad656ca09a24498ed77c3dca785f0d7468420ae685035',
+}
+
 
 def seed_database():
     """Seed the database with sample data."""
     conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
     
     print("Seeding database...")
     
-    # Create admin user if not exists
-    cur.execute("SELECT id FROM users WHERE username = 'admin'")
-    if not cur.fetchone():
-        cur.execute('''
-            INSERT INTO users (username, email, password_hash, role)
-            VALUES (?, ?, ?, ?)
-        ''', ['admin', 'admin@millpoint.dk', generate_password_hash('admin'), 'admin'])
-        print("  Created admin user (password: admin)")
+    # Keys already in the database, so existing rows are skipped without a lookup each
+    existing_users = {row[0] for row in conn.execute("SELECT username FROM users")}
+    existing_customers = {row[0] for row in conn.execute("SELECT name FROM customers")}
+    existing_suppliers = {row[0] for row in conn.execute("SELECT name FROM suppliers")}
+    existing_serials = {row[0] for row in conn.execute("SELECT serial_number FROM equipment")}
+    existing_jobs = {row[0] for row in conn.execute("SELECT internal_job_number FROM jobs")}
     
-    # Create sample users
+    # Create admin and sample users
     sample_users = [
+        ('admin', 'admin@millpoint.dk', 'admin', 'admin'),
         ('inspector1', 'inspector1@millpoint.dk', 'inspector', 'inspector123'),
         ('operator1', 'operator1@millpoint.dk', 'operator', 'operator123'),
         ('qm', 'quality@millpoint.dk', 'quality_manager', 'quality123'),
     ]
     
-    for username, email, role, password in sample_users:
-        cur.execute("SELECT id FROM users WHERE username = ?", [username])
-        if not cur.fetchone():
-            cur.execute('''
-                INSERT INTO users (username, email, password_hash, role)
-                VALUES (?, ?, ?, ?)
-            ''', [username, email, generate_password_hash(password), role])
-            print(f"  Created user: {username} (password: {password})")
+    new_users = [user for user in sample_users if user[0] not in existing_users]
+    conn.executemany('''
+        INSERT INTO users (username, email, password_hash, role)
+        VALUES (?, ?, ?, ?)
+    ''', [(username, email, SAMPLE_PASSWORD_HASHES[username], role)
+          for username, email, role, _ in new_users])
+    for username, _, _, password in new_users:
+        print(f"  Created user: {username} (password: {password})")
     
     # Create sample customers
     sample_customers = [
@@ -52,14 +57,15 @@ def seed_database():
         ('TechCorp Industries', 'Maria Jensen', 'maria@techcorp.com', '+45 33 44 55 66'),
     ]
     
-    for name, contact, email, phone in sample_customers:
-        cur.execute("SELECT id FROM customers WHERE name = ?", [name])
-        if not cur.fetchone():
-            cur.execute('''
-                INSERT INTO customers (name, contact_person, email, phone)
-                VALUES (?, ?, ?, ?)
-            ''', [name, contact, email, phone])
-            print(f"  Created customer: {name}")
+    new_customers = []
+    for customer in sample_customers:
+        if customer[0] not in existing_customers:
+            new_customers.append(customer)
+            print(f"  Created customer: {customer[0]}")
+    conn.executemany('''
+        INSERT INTO customers (name, contact_person, email, phone)
+        VALUES (?, ?, ?, ?)
+    ''', new_customers)
     
     # Create sample suppliers
     sample_suppliers = [
@@ -70,14 +76,15 @@ def seed_database():
         ('Heat Treat Solutions', 'external_process', 'Karen Møller', 'karen@heattreat.dk', '+45 88 99 00 11', 'heat treatment, hardening'),
     ]
     
-    for name, stype, contact, email, phone, processes in sample_suppliers:
-        cur.execute("SELECT id FROM suppliers WHERE name = ?", [name])
-        if not cur.fetchone():
-            cur.execute('''
-                INSERT INTO suppliers (name, supplier_type, contact_person, email, phone, processes_offered)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', [name, stype, contact, email, phone, processes])
-            print(f"  Created supplier: {name}")
+    new_suppliers = []
+    for supplier in sample_suppliers:
+        if supplier[0] not in existing_suppliers:
+            new_suppliers.append(supplier)
+            print(f"  Created supplier: {supplier[0]}")
+    conn.executemany('''
+        INSERT INTO suppliers (name, supplier_type, contact_person, email, phone, processes_offered)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', new_suppliers)
     
     # Create sample equipment
     sample_equipment = [
@@ -91,31 +98,31 @@ def seed_database():
     ]
     
     today = datetime.now().date()
+    last_cal = today - timedelta(days=180)  # 6 months ago
+    due_soon_date = today + timedelta(days=30)
+    new_equipment = []
     for name, etype, serial, manufacturer, interval in sample_equipment:
-        cur.execute("SELECT id FROM equipment WHERE serial_number = ?", [serial])
-        if not cur.fetchone():
-            last_cal = today - timedelta(days=180)  # 6 months ago
+        if serial not in existing_serials:
             due_date = last_cal + timedelta(days=interval)
             status = 'ok' if due_date > today else 'overdue'
-            if due_date <= today + timedelta(days=30):
+            if due_date <= due_soon_date:
                 status = 'due_soon'
             
-            cur.execute('''
-                INSERT INTO equipment (name, equipment_type, serial_number, manufacturer, 
-                                      calibration_interval_days, last_calibration_date, 
-                                      calibration_due_date, calibration_status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', [name, etype, serial, manufacturer, interval, 
-                  last_cal.isoformat(), due_date.isoformat(), status])
+            new_equipment.append((name, etype, serial, manufacturer, interval,
+                                  last_cal.isoformat(), due_date.isoformat(), status))
             print(f"  Created equipment: {name}")
+    conn.executemany('''
+        INSERT INTO equipment (name, equipment_type, serial_number, manufacturer, 
+                              calibration_interval_days, last_calibration_date, 
+                              calibration_due_date, calibration_status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', new_equipment)
     
     # Get IDs for foreign keys
-    cur.execute("SELECT id FROM customers WHERE name = 'Acme Manufacturing'")
-    customer1_id = cur.fetchone()['id']
-    cur.execute("SELECT id FROM customers WHERE name = 'Nordic Parts A/S'")
-    customer2_id = cur.fetchone()['id']
-    cur.execute("SELECT id FROM customers WHERE name = 'TechCorp Industries'")
-    customer3_id = cur.fetchone()['id']
+    customer_ids = dict(conn.execute("SELECT name, id FROM customers"))
+    customer1_id = customer_ids['Acme Manufacturing']
+    customer2_id = customer_ids['Nordic Parts A/S']
+    customer3_id = customer_ids['TechCorp Industries']
     
     # Create sample jobs
     sample_jobs = [
@@ -131,20 +138,27 @@ def seed_database():
          (today + timedelta(days=7)).isoformat(), 'revision_check', 'DWG-CVR-150'),
     ]
     
-    for po, job_num, cust_id, part, rev, desc, qty, due, stage, dwg in sample_jobs:
-        cur.execute("SELECT id FROM jobs WHERE internal_job_number = ?", [job_num])
-        if not cur.fetchone():
-            cur.execute('''
-                INSERT INTO jobs (po_number, internal_job_number, customer_id, part_number, 
-                                 part_revision, part_description, quantity, due_date, workflow_stage,
-                                 drawing_number)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', [po, job_num, cust_id, part, rev, desc, qty, due, stage, dwg])
+    new_jobs = []
+    for job in sample_jobs:
+        job_num, part, rev = job[1], job[3], job[4]
+        if job_num not in existing_jobs:
+            new_jobs.append(job)
             print(f"  Created job: {job_num} ({part} Rev {rev})")
+    # Jobs link to their part like jobs created in the app do
+    conn.executemany('''
+        INSERT OR IGNORE INTO parts (part_number, part_revision, part_description)
+        VALUES (?, ?, ?)
+    ''', [(job[3], job[4], job[5]) for job in new_jobs])
+    conn.executemany('''
+        INSERT INTO jobs (po_number, internal_job_number, customer_id, part_number, 
+                         part_revision, part_description, quantity, due_date, workflow_stage,
+                         drawing_number, part_id)
+        SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, id
+        FROM parts WHERE part_number = ?4 AND part_revision = ?5
+    ''', new_jobs)
     
     # Add dimensions to first job (SHAFT-100)
-    cur.execute("SELECT id FROM jobs WHERE internal_job_number = 'JOB00001'")
-    job1_id = cur.fetchone()['id']
+    job1_id = conn.execute("SELECT id FROM jobs WHERE internal_job_number = 'JOB00001'").fetchone()[0]
     
     sample_dimensions = [
         (1, 'Ø25 h7', 25.0, 0, -0.021, 'mm', 'Dim #1', 1),
@@ -154,24 +168,20 @@ def seed_database():
         (5, 'Thread M8x1.25', 0, 0, 0, 'go/nogo', 'Dim #5', 1),
     ]
     
-    cur.execute("SELECT id FROM job_dimensions WHERE job_id = ?", [job1_id])
-    if not cur.fetchone():
-        for num, name, nominal, tol_plus, tol_minus, unit, ref, critical in sample_dimensions:
-            cur.execute('''
-                INSERT INTO job_dimensions (job_id, dimension_number, dimension_name, 
-                                           nominal_value, tolerance_plus, tolerance_minus,
-                                           unit, drawing_reference, critical)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', [job1_id, num, name, nominal, tol_plus, tol_minus, unit, ref, critical])
+    if not conn.execute("SELECT id FROM job_dimensions WHERE job_id = ?", [job1_id]).fetchone():
+        conn.executemany('''
+            INSERT INTO job_dimensions (job_id, dimension_number, dimension_name, 
+                                       nominal_value, tolerance_plus, tolerance_minus,
+                                       unit, drawing_reference, critical)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(job1_id, *dimension) for dimension in sample_dimensions])
         print(f"  Added {len(sample_dimensions)} dimensions to JOB00001")
     
     # Create a sample error report
-    cur.execute("SELECT id FROM error_reports WHERE job_id = ?", [job1_id])
-    if not cur.fetchone():
-        cur.execute("SELECT id FROM users WHERE username = 'inspector1'")
-        inspector_id = cur.fetchone()['id']
+    if not conn.execute("SELECT id FROM error_reports WHERE job_id = ?", [job1_id]).fetchone():
+        inspector_id = conn.execute("SELECT id FROM users WHERE username = 'inspector1'").fetchone()[0]
         
-        cur.execute('''
+        conn.execute('''
             INSERT INTO error_reports (job_id, reported_by, workflow_stage, severity, 
                                       description, affected_quantity, status)
             VALUES (?, ?, ?, ?, ?, ?, ?)
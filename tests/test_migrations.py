@@ -0,0 +1,104 @@
+"""Upgrade tests for the schema migrations in init_db()."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import app as qa
+
+
+class MigrationTestCase(unittest.TestCase):
+    """Each test gets a fresh database at the current schema."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.old_database = qa.app.config['DATABASE']
+        qa.app.config['DATABASE'] = os.path.join(self.tmp, 'qa.db')
+        self.ctx = qa.app.app_context()
+        self.ctx.push()
+        qa.init_db()
+        self.db = qa.get_db()
+
+    def tearDown(self):
+        self.ctx.pop()
+        qa.app.config['DATABASE'] = self.old_database
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def downgrade(self, version):
+        """Pretend the database was last migrated at schema version."""
+        self.db.execute(f'PRAGMA user_version = {version}')
+        self.db.commit()
+
+    def count(self, table):
+        return self.db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+class ExitControlSampleUpgradeTest(MigrationTestCase):
+
+    def test_duplicate_samples_abort_upgrade_and_are_kept(self):
+        self.db.execute('DROP INDEX idx_exit_control_samples_ec_part')
+        self.db.executemany(
+            'INSERT INTO exit_control_samples (exit_control_id, part_number, overall_pass) VALUES (?, ?, ?)',
+            [(1, 7, None), (1, 7, 1), (1, 8, 1)]
+        )
+        self.downgrade(14)
+
+        with self.assertRaisesRegex(RuntimeError, r'exit_control_samples\(exit_control_id, part_number\)'):
+            qa.init_db()
+
+        self.assertEqual(self.count('exit_control_samples'), 3)
+
+    def test_upgrade_without_duplicates_adds_unique_index(self):
+        self.db.execute('DROP INDEX idx_exit_control_samples_ec_part')
+        self.db.executemany(
+            'INSERT INTO exit_control_samples (exit_control_id, part_number) VALUES (?, ?)',
+            [(1, 7), (1, 8)]
+        )
+        self.downgrade(14)
+
+        qa.init_db()
+
+        index = self.db.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'idx_exit_control_samples_ec_part'"
+        ).fetchone()
+        self.assertIn('UNIQUE', index[0])
+        self.assertEqual(self.count('exit_control_samples'), 2)
+
+
+class MeasurementUpgradeTest(MigrationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.db.execute('DROP INDEX idx_measurements_report_dimension_sample')
+        self.downgrade(15)
+
+    def insert_measurements(self, rows):
+        self.db.executemany(
+            'INSERT INTO measurements (report_id, job_dimension_id, actual_value, sample_number) VALUES (?, ?, ?, ?)',
+            rows
+        )
+        self.db.commit()
+
+    def test_missing_sample_numbers_are_numbered_not_deleted(self):
+        self.insert_measurements([(1, 10, 5.0, 1), (1, 10, 5.1, None), (1, 10, 5.2, None), (1, 11, 6.0, None)])
+
+        qa.init_db()
+
+        rows = self.db.execute(
+            'SELECT job_dimension_id, actual_value, sample_number FROM measurements ORDER BY id'
+        ).fetchall()
+        self.assertEqual([tuple(row) for row in rows],
+                         [(10, 5.0, 1), (10, 5.1, 2), (10, 5.2, 3), (11, 6.0, 1)])
+
+    def test_duplicate_measurements_abort_upgrade_and_are_kept(self):
+        self.insert_measurements([(1, 10, 5.0, 1), (1, 10, 5.1, 1)])
+
+        with self.assertRaisesRegex(RuntimeError, r'measurements\(report_id, job_dimension_id, sample_number\)'):
+            qa.init_db()
+
+        self.assertEqual(self.count('measurements'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()